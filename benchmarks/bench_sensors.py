@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks de CPU de la plataforma sensor.
+
+Mide, sobre payloads sintéticos (benchmarks/payloads.py) escalados por número
+de contratos e histórico:
+
+- parseo de precios (`api.parse_price_list`, `api.extract_gas_price`; se hace
+  al normalizar /houses, no al leer los sensores)
+- construcción de entidades (`_build_contract_entities`)
+- lecturas de `native_value`
+- fan-out completo de una actualización del coordinator (valor, atributos y
+  unidad de cada entidad, más el histórico local de costes)
+
+Requiere Home Assistant instalado (entorno de desarrollo). Uso:
+
+    python benchmarks/bench_sensors.py                        # imprime resultados
+    python benchmarks/bench_sensors.py --save benchmarks/baseline.json
+    python benchmarks/bench_sensors.py --compare benchmarks/baseline.json --max-regression 1.5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import payloads  # noqa: E402
+from custom_components.repsol_vivit import api, sensor  # noqa: E402
+from custom_components.repsol_vivit.history import ContractCostSeries  # noqa: E402
+from custom_components.repsol_vivit.vbrollup import VBRollups  # noqa: E402
+
+SCENARIOS: List[Tuple[int, int]] = [(2, 12), (20, 120), (100, 600)]
+REPEAT = 9
+# Casos más rápidos que esto (µs por llamada) se miden pero no cuentan como regresión:
+# en ese rango el ruido del sistema supera con facilidad el 25 %
+NOISE_FLOOR_US = 10.0
+
+
+def _time(fn: Callable[[], Any]) -> Dict[str, float]:
+    """Tiempo por llamada (µs): mediana y mínimo de REPEAT tandas."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    runs = [t / number * 1e6 for t in timer.repeat(repeat=REPEAT, number=number)]
+    return {"median_us": round(statistics.median(runs), 3), "min_us": round(min(runs), 3)}
+
+
+def _build_all(data: Dict[str, Dict[str, Any]], coordinator) -> List[Any]:
+    entities: List[Any] = []
+    house_contracts = sensor._house_contract_index(data)
+    for cid, payload in data.items():
+        ctype = payload["contracts"]["contractType"]
+        entities.extend(sensor._build_contract_entities(
+            data, cid, f"Contrato {cid}", ctype, coordinator, "EUR", house_contracts
+        ))
+    return entities
+
+
+def _fan_out(entities: List[Any]) -> None:
+    for ent in entities:
+        ent.native_value
+        ent.extra_state_attributes
+        ent.native_unit_of_measurement
+
+
+def run_scenario(contracts: int, history: int) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(contracts * 1000 + history)
+    data = payloads.coordinator_data(contracts, history)
+    for payload in data.values():
+        api._normalize_house(payload["house_data"])
+    VBRollups().add(data)
+    coordinator = SimpleNamespace(data=data, last_update_success=True)
+    entities = _build_all(data, coordinator)
+
+    power = payloads.price_strings(2, rng)
+    energy = payloads.price_strings(max(history // 10, 1), rng)
+    gas = payloads.gas_price_strings(max(history // 10, 2), rng)
+    series = [ContractCostSeries() for _ in data]
+
+    def _history_add() -> None:
+        for s, payload in zip(series, data.values()):
+            s.add(payload["costs"])
+            s.summary()
+
+    results = {
+        "parse_price_list": _time(lambda: (api.parse_price_list(power, 1),
+                                           api.parse_price_list(energy, len(energy) - 1))),
+        "extract_gas_price": _time(lambda: (api.extract_gas_price(gas, True),
+                                            api.extract_gas_price(gas, False))),
+        "build_entities": _time(lambda: _build_all(data, coordinator)),
+        "native_value_reads": _time(lambda: [e.native_value for e in entities]),
+        "coordinator_fan_out": _time(lambda: (_history_add(), _fan_out(entities))),
+    }
+    results["_entities"] = {"count": len(entities)}
+    return results
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de la plataforma sensor")
+    parser.add_argument("--save", type=Path, help="guarda los resultados como baseline JSON")
+    parser.add_argument("--compare", type=Path, help="compara contra un baseline JSON")
+    parser.add_argument("--max-regression", type=float, default=0.0,
+                        help="con --compare, falla si algún caso supera este ratio (p.ej. 1.5)")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Any] = {}
+    for contracts, history in SCENARIOS:
+        key = f"contracts={contracts},history={history}"
+        results[key] = run_scenario(contracts, history)
+
+    baseline = json.loads(args.compare.read_text())["results"] if args.compare else {}
+    worst = 0.0
+    changed: List[str] = []
+    # Se compara el mínimo: la mediana de pocas tandas es demasiado ruidosa entre ejecuciones
+    print(f"{'escenario':<30} {'caso':<22} {'mínimo µs':>12} {'baseline µs':>12} {'ratio':>7}")
+    for key, cases in results.items():
+        base_cases = baseline.get(key) or {}
+        # Otro número de entidades es otra carga: no se compara como tiempo
+        base_count = (base_cases.get("_entities") or {}).get("count")
+        if base_count is not None and base_count != cases["_entities"]["count"]:
+            changed.append(f"{key}: {base_count} -> {cases['_entities']['count']} entidades")
+            base_cases = {}
+        for name, res in cases.items():
+            if name.startswith("_"):
+                continue
+            base = base_cases.get(name, {}).get("min_us")
+            ratio = res["min_us"] / base if base else None
+            noisy = bool(base) and base < NOISE_FLOOR_US
+            if ratio and not noisy:
+                worst = max(worst, ratio)
+            print(f"{key:<30} {name:<22} {res['min_us']:>12.1f} "
+                  f"{(f'{base:.1f}' if base else '-'):>12} {(f'{ratio:.2f}' if ratio else '-'):>7}"
+                  f"{' (ruido, no cuenta)' if noisy else ''}")
+
+    if changed:
+        print("Carga distinta a la del baseline (vuelve a grabarlo con --save):")
+        for line in changed:
+            print(f"  {line}")
+
+    if args.save:
+        from homeassistant.const import __version__ as ha_version
+
+        meta = {"python": platform.python_version(), "homeassistant": ha_version, "machine": platform.machine()}
+        args.save.write_text(json.dumps({"meta": meta, "results": results}, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline guardado en {args.save}")
+
+    if args.compare and args.max_regression and worst > args.max_regression:
+        print(f"Regresión: ratio máximo {worst:.2f} > {args.max_regression}")
+        return 1
+    if args.compare and args.max_regression and changed:
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
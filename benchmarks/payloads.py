@@ -0,0 +1,117 @@
+"""Generadores de payloads sintéticos con la forma de `fetch_all_data`.
+
+El tamaño escala con el número de contratos (`contracts`, mitad luz y mitad
+gas, dos por vivienda) y con la longitud del histórico (`history`: entradas de
+`discounts.data`, `excedents.data`, facturas y cadenas de precios).
+"""
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List
+
+
+def price_strings(n: int, rng: random.Random) -> List[str]:
+    """Cadenas de precio como las del portal, con coma o punto decimal."""
+    out = []
+    for i in range(n):
+        value = f"{rng.uniform(0.01, 0.5):.6f}"
+        if i % 2 == 0:
+            value = value.replace(".", ",")
+        out.append(f"Periodo P{i + 1}: {value} €/kWh")
+    return out
+
+
+def gas_price_strings(n: int, rng: random.Random) -> List[str]:
+    base = [
+        f"Término Fijo: {rng.uniform(0.1, 0.4):.4f} €/día".replace(".", ","),
+        f"Término Variable: {rng.uniform(0.04, 0.1):.6f} €/kWh".replace(".", ","),
+    ]
+    # Relleno delante para que la búsqueda recorra la lista
+    return [f"Concepto {i}: sin importe" for i in range(max(n - 2, 0))] + base
+
+
+def _month(i: int) -> str:
+    year, month = divmod(i, 12)
+    return f"{2015 + year:04d}-{month + 1:02d}"
+
+
+def virtual_battery(contract_id: str, history: int, rng: random.Random) -> Dict[str, Any]:
+    excedents = [
+        {
+            "date": f"{_month(i)}-10",
+            "kWh": round(rng.uniform(20, 300), 2),
+            "amount": round(rng.uniform(1, 20), 2),
+            "conversionPrice": 0.07,
+        }
+        for i in range(history)
+    ]
+    discounts = [
+        {
+            "billingDate": f"{_month(i)}-05",
+            "amount": round(rng.uniform(1, 20), 2),
+            "kWh": round(rng.uniform(10, 250), 2),
+        }
+        for i in range(history)
+    ]
+    return {
+        "discounts": {
+            "contracts": [{"productCode": contract_id, "pendingAmount": round(rng.uniform(0, 50), 2)}],
+            "data": discounts,
+        },
+        "excedents": {
+            "appliedAmount": round(sum(d["amount"] for d in discounts), 2),
+            "totalkWh": round(sum(e["kWh"] for e in excedents), 2),
+            "data": excedents,
+        },
+    }
+
+
+def invoices(history: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "code": f"INV{i:06d}",
+            "amount": round(rng.uniform(30, 150), 2),
+            "consumption": round(rng.uniform(100, 600), 2),
+            "status": "PAID" if i else "PENDING",
+            "startDate": f"{_month(history - i - 1)}-01",
+            "endDate": f"{_month(history - i - 1)}-28",
+        }
+        for i in range(history)
+    ]
+
+
+def coordinator_data(contracts: int, history: int, seed: int = 1) -> Dict[str, Dict[str, Any]]:
+    """Dataset completo del coordinator para `contracts` contratos."""
+    rng = random.Random(seed)
+    data: Dict[str, Dict[str, Any]] = {}
+    for i in range(contracts):
+        house_id = f"H{i // 2:05d}"
+        ctype = "ELECTRICITY" if i % 2 == 0 else "GAS"
+        contract_id = f"C{i:06d}"
+        if ctype == "ELECTRICITY":
+            prices = {"power": price_strings(2, rng), "energy": price_strings(max(history // 10, 1), rng)}
+        else:
+            prices = {"energy": gas_price_strings(max(history // 10, 2), rng)}
+        # /houses devuelve todos los contratos de la vivienda
+        house_contracts = [
+            {"code": f"C{j:06d}", "status": "ACTIVE", "power": 4.6, "fee": "2.0TD", "prices": prices}
+            for j in (i - i % 2, i - i % 2 + 1)
+        ]
+        data[contract_id] = {
+            "contracts": {
+                "contract_id": contract_id,
+                "contractType": ctype,
+                "cups": f"ES{i:018d}",
+                "active": True,
+                "house_id": house_id,
+            },
+            "house_data": {"code": house_id, "contracts": house_contracts},
+            "invoices": invoices(min(history, 10), rng),
+            "costs": {
+                "totalDays": 15, "consumption": 210.5, "amount": 48.3,
+                "amountVariable": 30.1, "amountFixed": 18.2, "averageAmount": 3.22,
+            },
+            "nextInvoice": {"amount": 95.4, "amountVariable": 60.2, "amountFixed": 35.2},
+            "virtual_battery_history": virtual_battery(contract_id, history, rng) if ctype == "ELECTRICITY" else None,
+        }
+    return data
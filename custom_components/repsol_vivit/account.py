@@ -0,0 +1,154 @@
+"""Agregados a nivel de cuenta (todas las entradas con el mismo usuario).
+
+Cada entrada de configuración es un contrato; los totales de la cuenta se
+calculan una vez por actualización de cualquiera de sus coordinators, a partir
+de los datos ya normalizados, y solo se notifica a los sensores cuando cambia
+alguna de las entradas del cálculo o la disponibilidad.
+
+Los sensores de la cuenta los crea una sola entrada (la dueña); si se descarga,
+la plataforma de otra entrada de la misma cuenta los vuelve a crear.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .api import account_key
+from .const import ACCOUNTS_KEY, DOMAIN
+
+
+def _num(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _vb_pending(payload: Dict[str, Any], contract_id: str) -> Optional[float]:
+    vb = payload.get("virtual_battery_history") or {}
+    for c in (vb.get("discounts") or {}).get("contracts") or []:
+        if c.get("productCode") == contract_id:
+            return _num(c.get("pendingAmount"))
+    return None
+
+
+def _sum(values: List[Optional[float]]) -> Optional[float]:
+    present = [v for v in values if v is not None]
+    return round(sum(present), 2) if present else None
+
+
+class AccountAggregate:
+    """Totales de una cuenta a partir de los coordinators de sus entradas."""
+
+    def __init__(self, account_id: str) -> None:
+        self.account_id = account_id
+        self.owner: Optional[str] = None
+        self.totals: Dict[str, Any] = {}
+        self._coordinators: Dict[str, DataUpdateCoordinator] = {}
+        self._unsubs: Dict[str, CALLBACK_TYPE] = {}
+        self._inputs: Optional[Tuple[Any, ...]] = None
+        self._available = False
+        self._listeners: List[Callable[[], None]] = []
+        self._platforms: Dict[str, Callable[[], None]] = {}
+
+    @property
+    def available(self) -> bool:
+        return any(c.last_update_success for c in self._coordinators.values())
+
+    def add_coordinator(self, entry_id: str, coordinator: DataUpdateCoordinator) -> None:
+        self._coordinators[entry_id] = coordinator
+        self._unsubs[entry_id] = coordinator.async_add_listener(self._async_coordinator_updated)
+        self._async_coordinator_updated()
+
+    def remove_coordinator(self, entry_id: str) -> bool:
+        """Quita una entrada; devuelve True si la cuenta se ha quedado vacía."""
+        self._coordinators.pop(entry_id, None)
+        self._platforms.pop(entry_id, None)
+        unsub = self._unsubs.pop(entry_id, None)
+        if unsub is not None:
+            unsub()
+        self._async_coordinator_updated()
+        if self.owner == entry_id:
+            # Sus sensores ya se han quitado: los recrea otra entrada cargada
+            self.owner = None
+            self._async_assign_owner()
+        return not self._coordinators
+
+    @callback
+    def register_platform(self, entry_id: str, create_entities: Callable[[], None]) -> None:
+        """Registra cómo crear los sensores de la cuenta desde la plataforma de una entrada."""
+        self._platforms[entry_id] = create_entities
+        self._async_assign_owner()
+
+    @callback
+    def _async_assign_owner(self) -> None:
+        if self.owner is not None:
+            return
+        for entry_id, create_entities in self._platforms.items():
+            self.owner = entry_id
+            create_entities()
+            return
+
+    @callback
+    def async_add_listener(self, update_callback: Callable[[], None]) -> CALLBACK_TYPE:
+        self._listeners.append(update_callback)
+
+        @callback
+        def _remove() -> None:
+            self._listeners.remove(update_callback)
+
+        return _remove
+
+    @callback
+    def _async_coordinator_updated(self) -> None:
+        contracts: Dict[str, Dict[str, Any]] = {}
+        for coordinator in self._coordinators.values():
+            contracts.update(coordinator.data or {})
+
+        inputs = tuple(
+            (
+                cid,
+                _num((payload.get("costs") or {}).get("amount")),
+                _num((payload.get("trend") or {}).get("projected_bill")),
+                _vb_pending(payload, cid),
+                _num((payload.get("nextInvoice") or {}).get("amount")),
+            )
+            for cid, payload in sorted(contracts.items())
+        )
+        available = self.available
+        if inputs == self._inputs and available == self._available:
+            return
+        self._inputs = inputs
+        self._available = available
+
+        self.totals = {
+            "total_cost": _sum([i[1] for i in inputs]),
+            "total_projected_bill": _sum([i[2] for i in inputs]),
+            "battery_balance": _sum([i[3] for i in inputs]),
+            "total_next_invoice": _sum([i[4] for i in inputs]),
+            "contracts": [i[0] for i in inputs],
+        }
+        for update_callback in list(self._listeners):
+            update_callback()
+
+
+def account_id_for(username: str) -> str:
+    """Identificador estable de la cuenta (el mismo que usa el cliente en los logs)."""
+    return account_key(username)
+
+
+@callback
+def async_get_account(hass: HomeAssistant, username: str) -> AccountAggregate:
+    accounts: Dict[str, AccountAggregate] = hass.data[DOMAIN].setdefault(ACCOUNTS_KEY, {})
+    account_id = account_id_for(username)
+    if account_id not in accounts:
+        accounts[account_id] = AccountAggregate(account_id)
+    return accounts[account_id]
+
+
+@callback
+def async_release_account(hass: HomeAssistant, account: AccountAggregate, entry_id: str) -> None:
+    if account.remove_coordinator(entry_id):
+        hass.data[DOMAIN].get(ACCOUNTS_KEY, {}).pop(account.account_id, None)
@@ -0,0 +1,662 @@
+"""Cliente HTTP del área cliente Vivit/Repsol.
+
+No depende de Home Assistant (solo aiohttp), para poder usarse también desde
+scripts/ fuera de HA.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import re
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Mapping, Optional, List, Tuple
+
+import aiohttp
+
+from .failurelog import FAILURES, exc_status, resource_key
+from .httpcache import HTTP_CACHE_MAX_ENTRIES, ResponseCache, body_digest, decode_json
+from .const import (
+    LOGGER,
+    LOGIN_URL,
+    BASE_API_URL,
+    CONTRACTS_URL,
+    HOUSES_URL,
+    INVOICES_URL,
+    INVOICE_DOCUMENT_URL,
+    COSTS_URL,
+    NEXT_INVOICE_URL,
+    VIRTUAL_BATTERY_HISTORY_URL,
+    LOGIN_HEADERS,
+    CONTRACTS_HEADERS,
+    COOKIES_CONST,
+    LOGIN_DATA,
+    CONF_FETCH_CONCURRENCY,
+    CONF_REQUEST_RETRIES,
+    CONF_REQUEST_TIMEOUT,
+    CONF_RETRY_SLEEP_BASE,
+    DEFAULT_OPTIONS,
+    OFFLOAD_MIN_BYTES,
+    TTL_OPTIONS,
+)
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_PRICE_RE = re.compile(r"(\d+,\d+|\d+\.\d+)")
+
+
+def _parse_contracts(data: Any) -> Dict[str, List[Dict[str, Any]]]:
+    parsed: Dict[str, List[Dict[str, Any]]] = {"information": []}
+    for house in data or []:
+        hid = (house or {}).get("code")
+        for c in (house or {}).get("contracts", []):
+            parsed["information"].append({
+                "contract_id": c.get("code"),
+                "contractType": c.get("contractType"),
+                "cups": c.get("cups"),
+                "active": c.get("status") == "ACTIVE",
+                "house_id": hid,
+            })
+    return parsed
+
+
+def _normalize_costs(resp: Dict[str, Any]) -> Dict[str, Any]:
+    base = {"totalDays": 0, "consumption": 0, "amount": 0, "amountVariable": 0, "amountFixed": 0, "averageAmount": 0}
+    for k in base:
+        base[k] = resp.get(k, 0)
+    return base
+
+
+def parse_price_list(prices: List[str], index: int) -> Any:
+    """
+    Extrae números tipo '0,1234' o '0.1234' de una lista de strings y devuelve float.
+    Ej: ["Punta: 0,1234 €/kWh", "Valle: 0,0987 €/kWh"] -> 0.1234 (index=0)
+    """
+    parsed: List[str] = []
+    for p in prices:
+        m = _PRICE_RE.search(str(p))
+        if m:
+            parsed.append(m.group(1).replace(",", "."))
+    try:
+        return float(parsed[index])
+    except Exception:
+        return None
+
+
+def extract_gas_price(prices: List[str], fixed: bool) -> Any:
+    """Busca 'Término Fijo' o 'Término Variable' y devuelve float."""
+    key = "Término Fijo" if fixed else "Término Variable"
+    for p in prices:
+        if key in str(p):
+            m = _PRICE_RE.search(str(p))
+            if m:
+                try:
+                    return float(m.group(1).replace(",", "."))
+                except Exception:
+                    return None
+    return None
+
+
+def _normalize_house(resp: Dict[str, Any]) -> Dict[str, Any]:
+    """Añade `parsedPrices` a cada contrato: los sensores no parsean cadenas al leer."""
+    for c in (resp or {}).get("contracts") or []:
+        if not isinstance(c, dict):
+            continue
+        prices = c.get("prices") or {}
+        power = prices.get("power") or []
+        energy = prices.get("energy") or []
+        c["parsedPrices"] = {
+            "powerPunta": parse_price_list(power, 0),
+            "powerValle": parse_price_list(power, 1),
+            "energy": parse_price_list(energy, 0),
+            "gasFixed": extract_gas_price(energy, fixed=True),
+            "gasVariable": extract_gas_price(energy, fixed=False),
+        }
+    return resp
+
+
+def _normalize_next_invoice(resp: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "amount": resp.get("amount", 0),
+        "amountVariable": resp.get("amountVariable", 0),
+        "amountFixed": resp.get("amountFixed", 0),
+    }
+
+
+def _new_refresh_stats() -> Dict[str, float]:
+    return {"parsed": 0, "offloaded": 0, "loop_parse_ms": 0.0, "executor_parse_ms": 0.0}
+
+
+def account_key(username: str) -> str:
+    """Identificador estable de la cuenta sin exponer el usuario."""
+    return hashlib.sha256(username.strip().lower().encode()).hexdigest()[:16]
+
+
+class RepsolLuzYGasAPI:
+    """Cliente API para Vivit/Repsol."""
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        username: str,
+        password: str,
+        selected_contract_id: Optional[str] = None,
+        base_url: str = BASE_API_URL,
+        login_url: str = LOGIN_URL,
+        options: Optional[Mapping[str, Any]] = None,
+        http_cache_entries: int = HTTP_CACHE_MAX_ENTRIES,
+    ):
+        self.session = session
+        self.username = username
+        self.password = password
+        self.account_key = account_key(username)
+        self.selected_contract_id = selected_contract_id
+
+        # Endpoints sobrescribibles (p.ej. un servidor local de pruebas de carga)
+        self.base_url = base_url
+        self.login_url = login_url
+
+        self.uid: Optional[str] = None
+        self.signature: Optional[str] = None
+        self.timestamp: Optional[str] = None
+
+        # Cookies por instancia (puede iniciarse vacía)
+        self.cookies: Dict[str, str] = dict(COOKIES_CONST) if COOKIES_CONST else {}
+
+        # Caché por TTL: url -> (instante monotónico, respuesta)
+        self._ttl_cache: Dict[str, Tuple[float, Any]] = {}
+        self.apply_options(options or {})
+
+        # Caché HTTP (validadores + cuerpo procesado) por URL; 0 la desactiva
+        self.http_cache = ResponseCache(http_cache_entries)
+
+        # Memo por ciclo de refresco: url -> tarea compartida (None fuera de ciclo)
+        self._cycle_memo: Optional[Dict[str, asyncio.Future]] = None
+        self._cycle_depth = 0
+
+        # Tiempo de decodificación/normalización del último ciclo (loop vs executor)
+        self.refresh_stats: Dict[str, float] = _new_refresh_stats()
+
+    def apply_options(self, options: Mapping[str, Any]) -> None:
+        """Aplica opciones de red/caché en caliente (sin re-login)."""
+        opts = {**DEFAULT_OPTIONS, **options}
+        self.request_timeout = float(opts[CONF_REQUEST_TIMEOUT])
+        self.request_retries = int(opts[CONF_REQUEST_RETRIES])
+        self.retry_sleep_base = float(opts[CONF_RETRY_SLEEP_BASE])
+        self.fetch_concurrency = max(int(opts[CONF_FETCH_CONCURRENCY]), 1)
+        self.ttls: Dict[str, float] = {kind: float(opts[opt]) * 60 for kind, opt in TTL_OPTIONS.items()}
+
+    # ---------------- utils HTTP ----------------
+
+    def _url(self, template: str, *args: Any) -> str:
+        """Resuelve una URL de const.py contra `base_url`."""
+        return (self.base_url + template[len(BASE_API_URL):]).format(*args)
+
+    def _failure_key(self, url: str) -> str:
+        return resource_key(url, self.account_key)
+
+    def _ttl_get(self, kind: str, url: str) -> Tuple[bool, Any]:
+        ttl = self.ttls.get(kind, 0)
+        hit = self._ttl_cache.get(url)
+        if ttl > 0 and hit is not None and time.monotonic() - hit[0] < ttl:
+            return True, hit[1]
+        return False, None
+
+    def _ttl_put(self, kind: str, url: str, value: Any) -> None:
+        if self.ttls.get(kind, 0) > 0:
+            self._ttl_cache[url] = (time.monotonic(), value)
+        else:
+            self._ttl_cache.pop(url, None)
+
+    @contextlib.contextmanager
+    def _refresh_cycle(self) -> Iterator[None]:
+        """Durante un ciclo, los recursos compartidos entre contratos (`/houses/{id}`,
+        luz y gas de la misma vivienda) se piden una vez y comparten resultado.
+
+        Solo se memorizan esos: lo propio de cada contrato no se retiene hasta
+        el final del ciclo (el exportador recorre cuentas enteras).
+        """
+        if self._cycle_depth == 0:
+            self._cycle_memo = {}
+            self.refresh_stats = _new_refresh_stats()
+        self._cycle_depth += 1
+        try:
+            yield
+        finally:
+            self._cycle_depth -= 1
+            if self._cycle_depth == 0:
+                self._cycle_memo = None
+                FAILURES.tick()
+
+    async def _memo(self, url: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        memo = self._cycle_memo
+        if memo is None:
+            return await fetch()
+        fut = memo.get(url)
+        if fut is None:
+            fut = memo[url] = asyncio.ensure_future(fetch())
+        # shield: cancelar a un consumidor no cancela la petición compartida
+        return await asyncio.shield(fut)
+
+    async def _get_cached(
+        self, kind: str, url: str, normalize: Optional[Callable[[Any], Any]] = None
+    ) -> Any:
+        """GET JSON con caché TTL por tipo de endpoint y normalización opcional."""
+        hit, cached = self._ttl_get(kind, url)
+        if hit:
+            return cached
+        resp = await self._get_json(url, self._auth_headers(), normalize)
+        self._ttl_put(kind, url, resp)
+        return resp
+
+    def _conditional(self, url: str, headers: Dict[str, str]) -> Dict[str, str]:
+        """Cabeceras con If-None-Match / If-Modified-Since si hay entrada en caché."""
+        cond = self.http_cache.conditional_headers(url)
+        return {**headers, **cond} if cond else headers
+
+    async def _store_response(
+        self, url: str, r: aiohttp.ClientResponse, body: bytes,
+        normalize: Optional[Callable[[Any], Any]] = None,
+    ) -> Any:
+        """Decodifica (y normaliza) un 200, salvo que el cuerpo coincida con el cacheado.
+
+        Los cuerpos de OFFLOAD_MIN_BYTES o más se procesan en el executor: al
+        loop solo vuelve el resultado ya normalizado.
+        """
+        digest = body_digest(body)
+        hit, value = self.http_cache.same_body(url, digest)
+        if not hit:
+            parse = decode_json if normalize is None else (lambda b: normalize(decode_json(b)))
+            stats = self.refresh_stats
+            t0 = time.perf_counter()
+            if len(body) < OFFLOAD_MIN_BYTES:
+                value = parse(body)
+                stats["loop_parse_ms"] += (time.perf_counter() - t0) * 1000
+            else:
+                value = await asyncio.get_running_loop().run_in_executor(None, parse, body)
+                stats["executor_parse_ms"] += (time.perf_counter() - t0) * 1000
+                stats["offloaded"] += 1
+            stats["parsed"] += 1
+        return self.http_cache.put(url, r.headers, digest, value)
+
+    async def _get_json(
+        self, url: str, headers: Dict[str, str], normalize: Optional[Callable[[Any], Any]] = None
+    ) -> Any:
+        """GET con reintentos, re-login en 401/403, backoff en 429/5xx y caché HTTP."""
+        fresh, value = self.http_cache.fresh(url)
+        if fresh:
+            return value
+
+        last_exc: Optional[Exception] = None
+        for attempt in range(self.request_retries + 1):
+            try:
+                async with asyncio.timeout(self.request_timeout):
+                    async with self.session.get(
+                        url, headers=self._conditional(url, headers), cookies=self.cookies
+                    ) as r:
+                        if r.status == 304:
+                            FAILURES.recovered(self._failure_key(url))
+                            return self.http_cache.not_modified(url, r.headers)
+                        if r.status in (401, 403):
+                            LOGGER.info("GET %s -> %s. Re-login y reintento.", url, r.status)
+                            await self.async_login(reset_cookies=False)
+                            headers.update({
+                                "UID": self.uid or "",
+                                "signature": self.signature or "",
+                                "signatureTimestamp": self.timestamp or "",
+                            })
+                            continue
+                        if r.status in (429, 500, 502, 503, 504):
+                            body = (await r.text()) if FAILURES.wants_body else None
+                            FAILURES.report(self._failure_key(url), r.status, "Backoff", body)
+                            last_exc = Exception(f"HTTP {r.status}")
+                            await asyncio.sleep(self.retry_sleep_base * (attempt + 1))
+                            continue
+                        if r.status != 200:
+                            body = (await r.text())[:400]
+                            raise Exception(f"HTTP {r.status} {body}")
+                        FAILURES.recovered(self._failure_key(url))
+                        return await self._store_response(url, r, await r.read(), normalize)
+            except Exception as e:
+                last_exc = e
+                await asyncio.sleep(self.retry_sleep_base * (attempt + 1))
+        raise last_exc or Exception("request_failed")
+
+    # ---------------- login ----------------
+
+    async def async_login(self, reset_cookies: bool = False) -> bool:
+        """Login robusto con retry limpiando cookies si hay bloqueo 400006."""
+        if reset_cookies:
+            self.cookies = {}
+
+        data = dict(LOGIN_DATA)
+        data.update({"loginID": self.username, "password": self.password})
+        headers = dict(LOGIN_HEADERS)
+
+        for attempt in range(2):  # intento + 1 retry limpiando cookies
+            async with self.session.post(
+                self.login_url, headers=headers, cookies=self.cookies, data=data
+            ) as resp:
+                text = await resp.text()
+                if resp.status != 200:
+                    if "security issues" in text or "400006" in text:
+                        LOGGER.warning("Login bloqueado por seguridad. Reintentamos con cookies nuevas.")
+                        self.cookies = {}
+                        continue
+                    raise Exception(f"login_failed_http {resp.status} {text[:300]}")
+                try:
+                    payload = await resp.json(content_type=None)
+                except Exception:
+                    raise Exception(f"login_failed_parse {text[:300]}")
+
+                ui = payload.get("userInfo") or {}
+                self.uid = ui.get("UID")
+                self.signature = ui.get("UIDSignature")
+                self.timestamp = ui.get("signatureTimestamp")
+                if not (self.uid and self.signature and self.timestamp):
+                    self.cookies = {}
+                    if attempt == 0:
+                        continue
+                    raise Exception("login_failed_tokens")
+                return True
+
+        raise Exception("login_failed")
+
+    def _auth_headers(self) -> Dict[str, str]:
+        h = dict(CONTRACTS_HEADERS)
+        h.update({
+            "UID": self.uid or "",
+            "signature": self.signature or "",
+            "signatureTimestamp": self.timestamp or "",
+        })
+        return h
+
+    # ---------------- endpoints ----------------
+
+    async def async_get_contracts(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Listado de contratos con re-login si la API devuelve 0 transitoriamente."""
+        url = self._url(CONTRACTS_URL)
+        parsed = await self._get_json(url, self._auth_headers(), _parse_contracts)
+
+        if not parsed["information"]:
+            FAILURES.report(f"[{self.account_key}] contratos", "0 contratos", "Re-login y segundo intento")
+            await self.async_login(reset_cookies=True)
+            # La respuesta vacía no debe servirse desde la caché en el reintento
+            self.http_cache.discard(url)
+            parsed = await self._get_json(url, self._auth_headers(), _parse_contracts)
+
+        if parsed["information"]:
+            FAILURES.recovered(f"[{self.account_key}] contratos")
+        return parsed
+
+    async def async_get_invoices(self, house_id: str, contract_id: str):
+        url = self._url(INVOICES_URL, house_id, contract_id)
+        return await self._get_cached("invoices", url)
+
+    async def async_download_invoice(
+        self,
+        house_id: str,
+        contract_id: str,
+        invoice_id: str,
+        sink: Callable[[bytes], Awaitable[None]],
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    ) -> int:
+        """Descarga el documento de una factura en streaming hacia `sink`.
+
+        Solo se reintenta mientras no se haya entregado ningún trozo; devuelve
+        los bytes escritos.
+        """
+        headers = self._auth_headers()
+        url = self._url(INVOICE_DOCUMENT_URL, house_id, contract_id, invoice_id)
+        # Timeout por lectura de socket, no total: el PDF puede tardar en llegar entero
+        timeout = aiohttp.ClientTimeout(sock_connect=self.request_timeout, sock_read=self.request_timeout)
+        last_exc: Optional[Exception] = None
+
+        for attempt in range(self.request_retries + 1):
+            written = 0
+            try:
+                async with self.session.get(
+                    url, headers=headers, cookies=self.cookies, timeout=timeout
+                ) as r:
+                    if r.status in (401, 403):
+                        LOGGER.info("Invoice document %s -> %s. Re-login y reintento.", url, r.status)
+                        await self.async_login(reset_cookies=False)
+                        headers = self._auth_headers()
+                        continue
+                    if r.status in (429, 500, 502, 503, 504):
+                        FAILURES.report(self._failure_key(url), r.status, "Backoff")
+                        last_exc = Exception(f"HTTP {r.status}")
+                        await asyncio.sleep(self.retry_sleep_base * (attempt + 1))
+                        continue
+                    if r.status != 200:
+                        txt = (await r.text())[:400]
+                        raise Exception(f"HTTP {r.status} {txt}")
+                    async for chunk in r.content.iter_chunked(chunk_size):
+                        await sink(chunk)
+                        written += len(chunk)
+                    FAILURES.recovered(self._failure_key(url))
+                    return written
+            except Exception as e:  # noqa: BLE001
+                if written:
+                    raise
+                last_exc = e
+                await asyncio.sleep(self.retry_sleep_base * (attempt + 1))
+        raise last_exc or Exception("download_failed")
+
+    async def async_get_costs(self, house_id: str, contract_id: str):
+        url = self._url(COSTS_URL, house_id, contract_id)
+        return await self._get_cached("costs", url, _normalize_costs)
+
+    async def async_get_next_invoice(self, house_id: str, contract_id: str):
+        """Próxima factura: tolera estados 'no disponible' devolviendo 0s."""
+        url = self._url(NEXT_INVOICE_URL, house_id, contract_id)
+        return await self._fetch_next_invoice(url, house_id, contract_id)
+
+    async def _fetch_next_invoice(self, url: str, house_id: str, contract_id: str):
+        headers = self._auth_headers()
+        base = {"amount": 0, "amountVariable": 0, "amountFixed": 0}
+        last_exc: Exception | None = None
+
+        hit, cached = self._ttl_get("next_invoice", url)
+        if hit:
+            return cached
+        fresh, cached = self.http_cache.fresh(url)
+        if fresh:
+            return cached
+
+        for attempt in range(self.request_retries + 1):
+            try:
+                async with asyncio.timeout(self.request_timeout):
+                    async with self.session.get(
+                        url, headers=self._conditional(url, headers), cookies=self.cookies
+                    ) as r:
+                        if r.status in (200, 304):
+                            if r.status == 304:
+                                result = self.http_cache.not_modified(url, r.headers)
+                            else:
+                                result = await self._store_response(url, r, await r.read(), _normalize_next_invoice)
+                            FAILURES.recovered(self._failure_key(url))
+                            self._ttl_put("next_invoice", url, result)
+                            return result
+
+                        if r.status in (401, 403):
+                            LOGGER.info("Invoice estimate %s -> %s. Re-login y reintento.", url, r.status)
+                            await self.async_login(reset_cookies=False)
+                            headers = self._auth_headers()
+                            continue
+
+                        if r.status in (429, 500, 502, 503, 504):
+                            body = (await r.text()) if FAILURES.wants_body else None
+                            FAILURES.report(self._failure_key(url), r.status, "Backoff", body)
+                            last_exc = Exception(f"HTTP {r.status}")
+                            await asyncio.sleep(self.retry_sleep_base * (attempt + 1))
+                            continue
+
+                        # 400/404: estimación no disponible -> devolver 0s
+                        if r.status in (400, 404):
+                            txt = (await r.text())[:400]
+                            if (
+                                "InvoiceEstimateNotAvailableException" in txt
+                                or "invoice estimate" in txt.lower()
+                                or "not available" in txt.lower()
+                            ):
+                                FAILURES.recovered(self._failure_key(url))
+                                LOGGER.info("Invoice estimate no disponible para %s/%s. Devolviendo 0s.",
+                                            house_id, contract_id)
+                                return base
+                            # Cuerpo solo a nivel debug (FAILURES)
+                            FAILURES.report(self._failure_key(url), r.status, "Devolviendo 0s", txt)
+                            return base
+
+                        txt = (await r.text())[:400]
+                        raise Exception(f"HTTP {r.status} {txt}")
+
+            except Exception as e:  # noqa: BLE001
+                last_exc = e
+                await asyncio.sleep(self.retry_sleep_base * (attempt + 1))
+
+        FAILURES.report(self._failure_key(url), exc_status(last_exc), "Fallo persistente; devolviendo 0s",
+                        str(last_exc))
+        return base
+
+    async def async_get_virtual_battery_history(self, house_id: str, contract_id: str):
+        """Histórico de batería virtual; 404 conocido -> {}."""
+        url = self._url(VIRTUAL_BATTERY_HISTORY_URL, house_id, contract_id)
+        return await self._fetch_virtual_battery_history(url, house_id, contract_id)
+
+    async def _fetch_virtual_battery_history(self, url: str, house_id: str, contract_id: str):
+        headers = self._auth_headers()
+        last_exc: Exception | None = None
+
+        hit, cached = self._ttl_get("virtual_battery", url)
+        if hit:
+            return cached
+        fresh, cached = self.http_cache.fresh(url)
+        if fresh:
+            return cached
+
+        for attempt in range(self.request_retries + 1):
+            try:
+                async with asyncio.timeout(self.request_timeout):
+                    async with self.session.get(
+                        url, headers=self._conditional(url, headers), cookies=self.cookies
+                    ) as r:
+                        if r.status in (200, 304):
+                            if r.status == 304:
+                                resp = self.http_cache.not_modified(url, r.headers)
+                            else:
+                                resp = await self._store_response(url, r, await r.read())
+                            FAILURES.recovered(self._failure_key(url))
+                            self._ttl_put("virtual_battery", url, resp)
+                            return resp
+
+                        if r.status in (401, 403):
+                            LOGGER.info("VB history %s -> %s. Re-login y reintento.", url, r.status)
+                            await self.async_login(reset_cookies=False)
+                            headers = self._auth_headers()
+                            continue
+
+                        if r.status in (429, 500, 502, 503, 504):
+                            body = (await r.text()) if FAILURES.wants_body else None
+                            FAILURES.report(self._failure_key(url), r.status, "Backoff", body)
+                            last_exc = Exception(f"HTTP {r.status}")
+                            await asyncio.sleep(self.retry_sleep_base * (attempt + 1))
+                            continue
+
+                        if r.status in (400, 404):
+                            txt = (await r.text())[:400]
+                            if (
+                                "BatteryHistoryNotFoundException" in txt
+                                or "not found" in txt.lower()
+                            ):
+                                FAILURES.recovered(self._failure_key(url))
+                                LOGGER.info(
+                                    "VB history no disponible para %s/%s. Devolviendo {}.",
+                                    house_id, contract_id
+                                )
+                                return {}
+                            FAILURES.report(self._failure_key(url), r.status, "Devolviendo {}", txt)
+                            return {}
+
+                        txt = (await r.text())[:400]
+                        raise Exception(f"HTTP {r.status} {txt}")
+
+            except Exception as e:  # noqa: BLE001
+                last_exc = e
+                await asyncio.sleep(self.retry_sleep_base * (attempt + 1))
+
+        FAILURES.report(self._failure_key(url), exc_status(last_exc), "Fallo persistente; devolviendo {}",
+                        str(last_exc))
+        return {}
+
+    async def async_get_houseDetails(self, house_id: str):
+        url = self._url(HOUSES_URL, house_id)
+        return await self._memo(url, lambda: self._get_cached("house", url, _normalize_house))
+
+    # ---------------- orquestación ----------------
+
+    async def async_iter_contract_data(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Genera (contract_id, payload) contrato a contrato, sin acumular."""
+        with self._refresh_cycle():
+            async for item in self._iter_contract_data():
+                yield item
+
+    async def _iter_contract_data(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        if not (self.uid and self.signature and self.timestamp):
+            await self.async_login()
+
+        contracts_data = await self.async_get_contracts()
+        contracts_list = (contracts_data or {}).get("information") or []
+
+        if self.selected_contract_id:
+            contracts_list = [c for c in contracts_list if c.get("contract_id") == self.selected_contract_id]
+
+        if not contracts_list:
+            raise Exception("no_contracts")
+
+        # Contratos pendientes por vivienda: al entregar el último se suelta su /houses/{id}
+        per_house: Dict[str, int] = {}
+        for c in contracts_list:
+            per_house[c["house_id"]] = per_house.get(c["house_id"], 0) + 1
+
+        # Por tandas de `fetch_concurrency` contratos, entregados en orden
+        step = self.fetch_concurrency
+        for start in range(0, len(contracts_list), step):
+            batch = contracts_list[start:start + step]
+            if len(batch) == 1:
+                results = [await self._fetch_contract(batch[0])]
+            else:
+                results = await asyncio.gather(*(self._fetch_contract(c) for c in batch))
+            for contract, payload in zip(batch, results):
+                house_id = contract["house_id"]
+                per_house[house_id] -= 1
+                if not per_house[house_id] and self._cycle_memo is not None:
+                    self._cycle_memo.pop(self._url(HOUSES_URL, house_id), None)
+                yield contract["contract_id"], payload
+
+    async def _fetch_contract(self, contract: Dict[str, Any]) -> Dict[str, Any]:
+        """Todos los endpoints de un contrato."""
+        house_id = contract["house_id"]
+        contract_id = contract["contract_id"]
+
+        house_data = await self.async_get_houseDetails(house_id)
+        invoices_data = await self.async_get_invoices(house_id, contract_id)
+        costs_data = await self.async_get_costs(house_id, contract_id)
+        next_invoice_data = await self.async_get_next_invoice(house_id, contract_id)
+
+        vb_hist = None
+        if (contract.get("contractType") or "").upper() == "ELECTRICITY":
+            vb_hist = await self.async_get_virtual_battery_history(house_id, contract_id)
+
+        return {
+            "contracts": contract,
+            "house_data": house_data,
+            "invoices": invoices_data,
+            "costs": costs_data,
+            "nextInvoice": next_invoice_data,
+            "virtual_battery_history": vb_hist,
+        }
+
+    async def fetch_all_data(self) -> Dict[str, Any]:
+        """Carga de todos los datos de contratos (o del seleccionado)."""
+        return {cid: payload async for cid, payload in self.async_iter_contract_data()}
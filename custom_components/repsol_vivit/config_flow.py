@@ -7,6 +7,7 @@ import voluptuous as vol
 from aiohttp.client_exceptions import ClientConnectorError, ClientResponseError
 
 from homeassistant import config_entries
+from homeassistant.core import callback
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
 from .const import (
@@ -18,14 +19,26 @@ from .const import (
     CONTRACTS_HEADERS,
     COOKIES_CONST,
     LOGIN_DATA,
+    REQ_TIMEOUT,
+    CONF_UPDATE_INTERVAL,
+    CONF_REQUEST_TIMEOUT,
+    CONF_REQUEST_RETRIES,
+    CONF_RETRY_SLEEP_BASE,
+    CONF_FETCH_CONCURRENCY,
+    CONF_RECORD_TRAFFIC,
+    DEFAULT_OPTIONS,
+    TTL_OPTIONS,
 )
 
-REQ_TIMEOUT = 15
-
 
 class RepsolConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: config_entries.ConfigEntry) -> "VivitOptionsFlow":
+        return VivitOptionsFlow(config_entry)
+
     def __init__(self) -> None:
         self._creds: dict[str, Any] | None = None
         self._contracts: list[dict[str, Any]] | None = None
@@ -159,4 +172,35 @@ class RepsolConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             step_id="contract",
             data_schema=vol.Schema({vol.Required("contract_code"): vol.In(opts)}),
             errors=errors,
-        )
\ No newline at end of file
+        )
+
+
+class VivitOptionsFlow(config_entries.OptionsFlow):
+    """Ajustes de red y refresco; se aplican en caliente (ver __init__.py)."""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        # Guardado aparte: `OptionsFlow.config_entry` no existe antes de HA 2024.11
+        self._entry = config_entry
+
+    async def async_step_init(self, user_input: dict[str, Any] | None = None):
+        if user_input is not None:
+            return self.async_create_entry(data=user_input)
+
+        current = {**DEFAULT_OPTIONS, **self._entry.options}
+        schema: dict[Any, Any] = {
+            vol.Required(CONF_UPDATE_INTERVAL, default=current[CONF_UPDATE_INTERVAL]):
+                vol.All(vol.Coerce(int), vol.Range(min=5, max=1440)),
+            vol.Required(CONF_REQUEST_TIMEOUT, default=current[CONF_REQUEST_TIMEOUT]):
+                vol.All(vol.Coerce(int), vol.Range(min=5, max=120)),
+            vol.Required(CONF_REQUEST_RETRIES, default=current[CONF_REQUEST_RETRIES]):
+                vol.All(vol.Coerce(int), vol.Range(min=0, max=5)),
+            vol.Required(CONF_RETRY_SLEEP_BASE, default=current[CONF_RETRY_SLEEP_BASE]):
+                vol.All(vol.Coerce(float), vol.Range(min=0, max=30)),
+            vol.Required(CONF_FETCH_CONCURRENCY, default=current[CONF_FETCH_CONCURRENCY]):
+                vol.All(vol.Coerce(int), vol.Range(min=1, max=8)),
+        }
+        for opt in TTL_OPTIONS.values():
+            schema[vol.Required(opt, default=current[opt])] = vol.All(vol.Coerce(int), vol.Range(min=0, max=10080))
+        schema[vol.Required(CONF_RECORD_TRAFFIC, default=current[CONF_RECORD_TRAFFIC])] = bool
+
+        return self.async_show_form(step_id="init", data_schema=vol.Schema(schema))
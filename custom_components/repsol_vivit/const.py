@@ -13,6 +13,7 @@ BASE_API_URL = "https://areacliente.repsol.es/api/proxy/"
 CONTRACTS_URL = f"{BASE_API_URL}houses"
 HOUSES_URL = f"{BASE_API_URL}houses/{{}}"
 INVOICES_URL = f"{BASE_API_URL}houses/{{}}/products/{{}}/invoices?limit=10"
+INVOICE_DOCUMENT_URL = f"{BASE_API_URL}houses/{{}}/products/{{}}/invoices/{{}}/pdf"
 COSTS_URL = f"{BASE_API_URL}houses/{{}}/products/{{}}/consumption/accumulated"
 NEXT_INVOICE_URL = f"{BASE_API_URL}houses/{{}}/products/{{}}/consumption/invoice-estimate"
 VIRTUAL_BATTERY_HISTORY_URL = f"{BASE_API_URL}houses/{{}}/products/{{}}/virtual-battery/history"
@@ -20,6 +21,81 @@ VIRTUAL_BATTERY_HISTORY_URL = f"{BASE_API_URL}houses/{{}}/products/{{}}/virtual-
 # Intervalo de actualización
 UPDATE_INTERVAL = timedelta(minutes=120)
 
+# Parámetros de robustez/red (valores por defecto; ajustables en opciones)
+REQ_TIMEOUT = 15            # seg por request
+REQUEST_RETRIES = 1         # nº de reintentos adicionales
+RETRY_SLEEP_BASE = 1.0      # backoff lineal (1s, 2s, ...)
+FETCH_CONCURRENCY = 1       # contratos consultados en paralelo por refresco
+
+# Cuerpos a partir de este tamaño se decodifican/normalizan en el executor
+OFFLOAD_MIN_BYTES = 64 * 1024
+# Históricos de batería virtual con más registros nuevos se agregan en el executor
+OFFLOAD_MIN_RECORDS = 2000
+
+# Opciones (options flow). Los TTL van en minutos; 0 = pedir siempre.
+CONF_UPDATE_INTERVAL = "update_interval"
+CONF_REQUEST_TIMEOUT = "request_timeout"
+CONF_REQUEST_RETRIES = "request_retries"
+CONF_RETRY_SLEEP_BASE = "retry_sleep_base"
+CONF_FETCH_CONCURRENCY = "fetch_concurrency"
+CONF_TTL_HOUSE = "ttl_house"
+CONF_TTL_INVOICES = "ttl_invoices"
+CONF_TTL_COSTS = "ttl_costs"
+CONF_TTL_NEXT_INVOICE = "ttl_next_invoice"
+CONF_TTL_VIRTUAL_BATTERY = "ttl_virtual_battery"
+CONF_RECORD_TRAFFIC = "record_traffic"
+
+# Tipo de endpoint -> opción con su TTL
+TTL_OPTIONS = {
+    "house": CONF_TTL_HOUSE,
+    "invoices": CONF_TTL_INVOICES,
+    "costs": CONF_TTL_COSTS,
+    "next_invoice": CONF_TTL_NEXT_INVOICE,
+    "virtual_battery": CONF_TTL_VIRTUAL_BATTERY,
+}
+
+DEFAULT_OPTIONS = {
+    CONF_UPDATE_INTERVAL: int(UPDATE_INTERVAL.total_seconds() // 60),
+    CONF_REQUEST_TIMEOUT: REQ_TIMEOUT,
+    CONF_REQUEST_RETRIES: REQUEST_RETRIES,
+    CONF_RETRY_SLEEP_BASE: RETRY_SLEEP_BASE,
+    CONF_FETCH_CONCURRENCY: FETCH_CONCURRENCY,
+    **{opt: 0 for opt in TTL_OPTIONS.values()},
+    CONF_RECORD_TRAFFIC: False,
+}
+
+# Fallos repetidos del portal: un warning por grupo hasta que se recupera y un
+# recordatorio por ventana mientras siga abierto (>= intervalo máximo, 1440 min)
+FAILURE_LOG_WINDOW = 24 * 3600    # seg
+
+# Clave en hass.data[DOMAIN] con los agregados por cuenta (account.py)
+ACCOUNTS_KEY = "_accounts"
+
+# Servicios
+SERVICE_DOWNLOAD_INVOICES = "download_invoices"
+SERVICE_PROFILE_REFRESH = "profile_refresh"
+
+# Perfilado bajo demanda (servicio profile_refresh)
+PROFILE_DIR = "repsol_vivit/profiles"
+PROFILE_LAG_INTERVAL = 0.05     # seg entre muestras de retraso del event loop
+PROFILE_TOP_N = 25
+
+# Grabación del tráfico HTTP (opción record_traffic) bajo /config
+RECORDINGS_DIR = "repsol_vivit/recordings"
+
+# Descarga de facturas (PDF) bajo /config
+INVOICES_DIR = "repsol_vivit/invoices"
+INVOICE_DOWNLOAD_CONCURRENCY = 2
+
+# Histórico local de costes (proyecciones)
+HISTORY_STORAGE_VERSION = 1
+HISTORY_MAX_POINTS = 1000               # ~80 días a 12 puntos/día
+HISTORY_MAX_AGE = timedelta(days=400)
+HISTORY_SAVE_DELAY = 60                 # seg (agrupa escrituras a disco)
+HISTORY_EMA_ALPHA = 0.3
+HISTORY_DEFAULT_CYCLE_DAYS = 30
+INVOICE_HISTORY_MAX = 60                # facturas por contrato (~5 años)
+
 # --- Referers canónicos (nuevo) ---
 REFERER_PRODUCTS = "https://areacliente.repsol.es/productos-y-servicios"
 REFERER_BILLING  = "https://areacliente.repsol.es/mis-facturas"
@@ -0,0 +1,100 @@
+"""Registro agrupado de fallos repetidos del portal.
+
+Los fallos se agrupan por (recurso, estado) y el grupo sigue abierto hasta
+que ese mismo recurso vuelve a responder: el primer fallo sale como warning (sin
+cuerpo), los siguientes solo se cuentan y, al recuperarse, una sola línea
+resume cuántos hubo. Si la caída dura más de una ventana se emite un único
+recordatorio por ventana con los grupos que siguen fallando. Los cuerpos de
+respuesta solo se registran a nivel debug.
+
+Sin dependencias de Home Assistant (lo usa `api.py`).
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from .const import FAILURE_LOG_WINDOW, LOGGER
+
+# Columnas de cada grupo abierto
+COUNT, SINCE, REMINDED = range(3)
+
+
+def resource_key(url: str, scope: str = "") -> str:
+    """Ruta completa (con los ids de vivienda/contrato), precedida de la cuenta si se da.
+
+    Así un contrato o una cuenta que responden bien no cierran el grupo de otro.
+    """
+    path = urlsplit(url).path
+    return f"[{scope}] {path}" if scope else path
+
+
+def exc_status(exc: Optional[BaseException]) -> str:
+    """Estado agrupable de una excepción: 'HTTP 503' o el nombre de la clase."""
+    msg = str(exc or "")
+    if msg.startswith("HTTP "):
+        return " ".join(msg.split(" ", 2)[:2])
+    return type(exc).__name__ if exc is not None else "desconocido"
+
+
+class FailureLog:
+    """Grupos por (recurso, estado) abiertos hasta que ese recurso se recupera."""
+
+    def __init__(self, window: float = FAILURE_LOG_WINDOW, logger: logging.Logger = LOGGER) -> None:
+        self.window = window
+        self._logger = logger
+        # recurso -> estado -> [fallos, desde, fallos ya recordados]
+        self._groups: Dict[str, Dict[str, List[float]]] = {}
+        self._window_start = time.monotonic()
+
+    @property
+    def wants_body(self) -> bool:
+        """Si merece la pena leer el cuerpo de la respuesta para registrarlo."""
+        return self._logger.isEnabledFor(logging.DEBUG)
+
+    def report(self, resource: str, status: object, detail: str = "", body: Optional[str] = None) -> None:
+        self.tick()
+        statuses = self._groups.setdefault(resource, {})
+        group = statuses.get(str(status))
+        if group is None:
+            group = statuses[str(status)] = [0, time.monotonic(), 0]
+            self._logger.warning(
+                "%s -> %s%s (repeticiones agrupadas hasta que se recupere)",
+                resource, status, f". {detail}" if detail else "",
+            )
+        group[COUNT] += 1
+        if body is not None:
+            self._logger.debug("%s -> %s (%d). Body=%s", resource, status, group[COUNT], body[:400])
+
+    def recovered(self, resource: str) -> None:
+        """Cierra los grupos del recurso tras una respuesta válida suya."""
+        statuses = self._groups.pop(resource, None)
+        if not statuses:
+            return
+        since = min(g[SINCE] for g in statuses.values())
+        self._logger.info(
+            "%s recuperado tras %d min: %s",
+            resource, (time.monotonic() - since) // 60,
+            "; ".join(f"{st} x{g[COUNT]}" for st, g in statuses.items()),
+        )
+
+    def tick(self) -> None:
+        """Al vencer la ventana, recuerda los grupos abiertos con fallos nuevos."""
+        now = time.monotonic()
+        if now - self._window_start < self.window:
+            return
+        pending = []
+        for resource, statuses in self._groups.items():
+            for status, group in statuses.items():
+                if group[COUNT] > group[REMINDED]:
+                    pending.append(f"{resource} -> {status} x{group[COUNT]} ({(now - group[SINCE]) // 60:.0f} min)")
+                    group[REMINDED] = group[COUNT]
+        if pending:
+            self._logger.warning("Fallos que persisten: %s", "; ".join(pending))
+        self._window_start = now
+
+
+# Compartido por todas las entradas: una caída del portal genera un solo resumen
+FAILURES = FailureLog()
@@ -0,0 +1,160 @@
+"""Histórico local de snapshots de costes y proyecciones incrementales."""
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    DOMAIN,
+    HISTORY_DEFAULT_CYCLE_DAYS,
+    HISTORY_EMA_ALPHA,
+    HISTORY_MAX_AGE,
+    HISTORY_MAX_POINTS,
+    HISTORY_SAVE_DELAY,
+    HISTORY_STORAGE_VERSION,
+)
+
+# Columnas de cada punto de la serie (listas, no dicts, para que el JSON sea compacto)
+TS, AMOUNT, CONSUMPTION, TOTAL_DAYS = range(4)
+
+
+def _num(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ContractCostSeries:
+    """Serie acotada de snapshots de un contrato con estadísticos incrementales.
+
+    Cada punto nuevo actualiza el estado en O(1): tasa diaria de coste y de
+    consumo (media móvil exponencial sobre los incrementos entre días del
+    ciclo) y duración media de ciclo aprendida en cada cambio de periodo.
+    """
+
+    def __init__(self, stored: Optional[Dict[str, Any]] = None) -> None:
+        stored = stored or {}
+        self.points: Deque[List[float]] = deque(stored.get("series") or [], maxlen=HISTORY_MAX_POINTS)
+        state = stored.get("state") or {}
+        self.cost_rate: Optional[float] = state.get("cost_rate")
+        self.kwh_rate: Optional[float] = state.get("kwh_rate")
+        self.cycle_days_sum: float = state.get("cycle_days_sum", 0.0)
+        self.cycles: int = state.get("cycles", 0)
+
+    @property
+    def last(self) -> Optional[List[float]]:
+        return self.points[-1] if self.points else None
+
+    @property
+    def cycle_length(self) -> float:
+        if self.cycles:
+            return self.cycle_days_sum / self.cycles
+        return float(HISTORY_DEFAULT_CYCLE_DAYS)
+
+    def add(self, costs: Dict[str, Any], now: Optional[float] = None) -> bool:
+        """Añade un snapshot; devuelve False si no aporta nada nuevo."""
+        point = [
+            round(now if now is not None else time.time()),
+            _num(costs.get("amount")),
+            _num(costs.get("consumption")),
+            _num(costs.get("totalDays")),
+        ]
+        prev = self.last
+        if prev is not None and prev[AMOUNT:] == point[AMOUNT:]:
+            return False
+
+        if prev is not None:
+            d_days = point[TOTAL_DAYS] - prev[TOTAL_DAYS]
+            if d_days < 0 or point[AMOUNT] < prev[AMOUNT]:
+                # Nuevo ciclo de facturación: el último totalDays es su duración
+                if prev[TOTAL_DAYS] > 0:
+                    self.cycle_days_sum += prev[TOTAL_DAYS]
+                    self.cycles += 1
+            elif d_days > 0:
+                self.cost_rate = self._ema(self.cost_rate, (point[AMOUNT] - prev[AMOUNT]) / d_days)
+                self.kwh_rate = self._ema(self.kwh_rate, (point[CONSUMPTION] - prev[CONSUMPTION]) / d_days)
+
+        self.points.append(point)
+        cutoff = point[TS] - HISTORY_MAX_AGE.total_seconds()
+        while self.points and self.points[0][TS] < cutoff:
+            self.points.popleft()
+        return True
+
+    @staticmethod
+    def _ema(current: Optional[float], sample: float) -> float:
+        if current is None:
+            return sample
+        return current + HISTORY_EMA_ALPHA * (sample - current)
+
+    def summary(self) -> Dict[str, Any]:
+        """Valores derivados para los sensores (sin recorrer la serie)."""
+        last = self.last
+        if last is None:
+            return {}
+        days = last[TOTAL_DAYS]
+        avg_cost = last[AMOUNT] / days if days > 0 else None
+        avg_kwh = last[CONSUMPTION] / days if days > 0 else None
+        cost_rate = self.cost_rate if self.cost_rate is not None else avg_cost
+
+        projected = None
+        if cost_rate is not None:
+            remaining = max(self.cycle_length - days, 0.0)
+            projected = round(last[AMOUNT] + cost_rate * remaining, 2)
+
+        trend_pct = None
+        if self.kwh_rate is not None and avg_kwh:
+            trend_pct = round((self.kwh_rate - avg_kwh) / avg_kwh * 100, 1)
+
+        return {
+            "daily_cost_rate": round(cost_rate, 2) if cost_rate is not None else None,
+            "projected_bill": projected,
+            "consumption_trend": round(self.kwh_rate, 2) if self.kwh_rate is not None else None,
+            "consumption_cycle_average": round(avg_kwh, 2) if avg_kwh is not None else None,
+            "consumption_trend_pct": trend_pct,
+            "cycle_length": round(self.cycle_length, 1),
+            "points": len(self.points),
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "series": list(self.points),
+            "state": {
+                "cost_rate": self.cost_rate,
+                "kwh_rate": self.kwh_rate,
+                "cycle_days_sum": self.cycle_days_sum,
+                "cycles": self.cycles,
+            },
+        }
+
+
+class CostHistory:
+    """Histórico persistente por entrada de configuración."""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self._store: Store = Store(hass, HISTORY_STORAGE_VERSION, f"{DOMAIN}.{entry_id}.costs")
+        self._series: Dict[str, ContractCostSeries] = {}
+
+    async def async_load(self) -> None:
+        stored = await self._store.async_load() or {}
+        self._series = {cid: ContractCostSeries(s) for cid, s in stored.items()}
+
+    def add(self, data: Dict[str, Any]) -> None:
+        """Registra los costes del refresco y anota `trend` en cada contrato."""
+        changed = False
+        for contract_id, payload in data.items():
+            series = self._series.setdefault(contract_id, ContractCostSeries())
+            changed |= series.add(payload.get("costs") or {})
+            payload["trend"] = series.summary()
+        if changed:
+            self._store.async_delay_save(self._data_to_save, HISTORY_SAVE_DELAY)
+
+    def _data_to_save(self) -> Dict[str, Any]:
+        return {cid: s.as_dict() for cid, s in self._series.items()}
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
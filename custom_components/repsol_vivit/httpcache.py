@@ -0,0 +1,140 @@
+"""Caché HTTP de respuestas JSON ya procesadas.
+
+Guarda por URL los validadores (ETag / Last-Modified), la frescura indicada
+por el servidor (Cache-Control / Expires) y el valor ya decodificado y
+normalizado. Si el portal no envía validadores, un hash del cuerpo permite
+saltarse el `json.loads` y la normalización cuando el contenido no cambia.
+
+Sin dependencias de Home Assistant (lo usa `api.py`).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+HTTP_CACHE_MAX_ENTRIES = 256
+
+
+class CacheEntry:
+    __slots__ = ("etag", "last_modified", "expires", "digest", "value")
+
+    def __init__(self, etag: Optional[str], last_modified: Optional[str],
+                 expires: float, digest: bytes, value: Any) -> None:
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+        self.digest = digest
+        self.value = value
+
+
+def _freshness(headers: Mapping[str, str]) -> Tuple[bool, float]:
+    """(almacenable, segundos de frescura) según Cache-Control / Expires."""
+    directives: Dict[str, Optional[str]] = {}
+    for part in (headers.get("Cache-Control") or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+
+    if "no-store" in directives:
+        return False, 0.0
+    if "no-cache" in directives:
+        return True, 0.0
+    if directives.get("max-age"):
+        try:
+            return True, max(float(directives["max-age"]), 0.0)
+        except ValueError:
+            return True, 0.0
+    if headers.get("Expires"):
+        try:
+            expires = parsedate_to_datetime(headers["Expires"])
+            date = parsedate_to_datetime(headers["Date"]) if headers.get("Date") else None
+            if date is not None:
+                return True, max((expires - date).total_seconds(), 0.0)
+            return True, max(expires.timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return True, 0.0
+    return True, 0.0
+
+
+def body_digest(body: bytes) -> bytes:
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+def decode_json(body: bytes) -> Any:
+    """Equivalente a `ClientResponse.json(content_type=None)` sobre bytes."""
+    return json.loads(body) if body.strip() else None
+
+
+class ResponseCache:
+    """LRU acotada url -> CacheEntry (`max_entries=0`: no guarda nada)."""
+
+    def __init__(self, max_entries: int = HTTP_CACHE_MAX_ENTRIES) -> None:
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._max = max_entries
+        self.hits = {"fresh": 0, "not_modified": 0, "same_body": 0, "miss": 0}
+
+    def fresh(self, url: str) -> Tuple[bool, Any]:
+        """Valor aún fresco según el servidor: se puede servir sin petición."""
+        entry = self._entries.get(url)
+        if entry is not None and entry.expires > time.monotonic():
+            self._entries.move_to_end(url)
+            self.hits["fresh"] += 1
+            return True, entry.value
+        return False, None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        entry = self._entries.get(url)
+        if entry is None:
+            return {}
+        headers: Dict[str, str] = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def not_modified(self, url: str, headers: Mapping[str, str]) -> Any:
+        """Respuesta 304: renueva la frescura y devuelve el valor guardado."""
+        entry = self._entries.get(url)
+        if entry is None:
+            raise Exception("HTTP 304 sin entrada en caché")
+        _, ttl = _freshness(headers)
+        entry.expires = time.monotonic() + ttl
+        self._entries.move_to_end(url)
+        self.hits["not_modified"] += 1
+        return entry.value
+
+    def same_body(self, url: str, digest: bytes) -> Tuple[bool, Any]:
+        """Valor ya procesado si el cuerpo recibido coincide con el cacheado."""
+        entry = self._entries.get(url)
+        if entry is not None and entry.digest == digest:
+            self.hits["same_body"] += 1
+            return True, entry.value
+        self.hits["miss"] += 1
+        return False, None
+
+    def put(self, url: str, headers: Mapping[str, str], digest: bytes, value: Any) -> Any:
+        """Guarda un valor ya procesado según la frescura de `headers`."""
+        storable, ttl = _freshness(headers)
+        if not storable or not self._max:
+            self._entries.pop(url, None)
+            return value
+
+        self._entries[url] = CacheEntry(
+            headers.get("ETag"),
+            headers.get("Last-Modified"),
+            time.monotonic() + ttl,
+            digest,
+            value,
+        )
+        self._entries.move_to_end(url)
+        while len(self._entries) > self._max:
+            self._entries.popitem(last=False)
+        return value
+
+    def discard(self, url: str) -> None:
+        self._entries.pop(url, None)
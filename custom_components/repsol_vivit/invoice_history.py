@@ -0,0 +1,168 @@
+"""Histórico local de facturas y analítica de precio efectivo.
+
+El portal solo devuelve las últimas facturas; aquí se acumulan por contrato
+y, para cada factura nueva, se calcula una vez su €/kWh, las medias móviles
+de 3 y 12 meses (ponderadas por kWh) y la variación interanual. Las facturas
+ya vistas no se vuelven a procesar.
+"""
+from __future__ import annotations
+
+import bisect
+from typing import Any, Dict, List, Optional
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN, HISTORY_SAVE_DELAY, HISTORY_STORAGE_VERSION, INVOICE_HISTORY_MAX
+from .invoices import invoice_id
+from .vbrollup import month_of
+
+INVOICE_DATE_KEYS = ("endDate", "billingDate", "issueDate", "date", "startDate")
+
+# Columnas de cada fila (listas, no dicts, para que el JSON sea compacto)
+MONTH, ID, AMOUNT, KWH, PRICE, AVG_3M, AVG_12M, YOY = range(8)
+
+
+def _num(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _month_index(month: str) -> int:
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def _month_label(index: int) -> str:
+    year, month = divmod(index, 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+
+class ContractInvoiceSeries:
+    """Facturas de un contrato ordenadas por mes, con métricas ya derivadas."""
+
+    def __init__(self, stored: Optional[Dict[str, Any]] = None) -> None:
+        self.rows: List[List[Any]] = (stored or {}).get("rows") or []
+        self._ids = {row[ID] for row in self.rows}
+        self._source: Any = None
+
+    def add(self, invoices: Any) -> bool:
+        """Incorpora las facturas no vistas; devuelve False si no hay ninguna."""
+        if invoices is self._source:
+            return False
+        self._source = invoices
+        if isinstance(invoices, dict):
+            invoices = [invoices]
+
+        first_dirty: Optional[int] = None
+        last_dirty = 0
+        for inv in invoices or []:
+            iid = invoice_id(inv)
+            if not iid or iid in self._ids:
+                continue
+            month = month_of(inv, INVOICE_DATE_KEYS)
+            if month is None:
+                continue
+            idx = _month_index(month)
+            amount = _num(inv.get("amount", inv.get("totalAmount")))
+            kwh = _num(inv.get("consumption", inv.get("kWh")))
+            row = [idx, iid, amount, kwh, None, None, None, None]
+            self.rows.insert(bisect.bisect_right(self.rows, idx, key=lambda r: r[MONTH]), row)
+            self._ids.add(iid)
+            first_dirty = idx if first_dirty is None else min(first_dirty, idx)
+            last_dirty = max(last_dirty, idx)
+
+        if first_dirty is None:
+            return False
+
+        while len(self.rows) > INVOICE_HISTORY_MAX:
+            self._ids.discard(self.rows.pop(0)[ID])
+
+        # Una factura solo influye en las de los 12 meses siguientes
+        start = bisect.bisect_left(self.rows, first_dirty, key=lambda r: r[MONTH])
+        for i in range(start, len(self.rows)):
+            if self.rows[i][MONTH] > last_dirty + 12:
+                break
+            self._derive(i)
+        return True
+
+    def _derive(self, i: int) -> None:
+        row = self.rows[i]
+        if row[AMOUNT] is not None and row[KWH]:
+            row[PRICE] = round(row[AMOUNT] / row[KWH], 4)
+        sums = {3: [0.0, 0.0], 12: [0.0, 0.0]}
+        prev_year_price = None
+        for j in range(i, -1, -1):
+            other = self.rows[j]
+            age = row[MONTH] - other[MONTH]
+            if age >= 12:
+                if age == 12 and prev_year_price is None:
+                    prev_year_price = other[PRICE]
+                if age > 12:
+                    break
+                continue
+            if other[AMOUNT] is None or not other[KWH]:
+                continue
+            for window, acc in sums.items():
+                if age < window:
+                    acc[0] += other[AMOUNT]
+                    acc[1] += other[KWH]
+        row[AVG_3M] = round(sums[3][0] / sums[3][1], 4) if sums[3][1] else None
+        row[AVG_12M] = round(sums[12][0] / sums[12][1], 4) if sums[12][1] else None
+        if row[PRICE] is not None and prev_year_price:
+            row[YOY] = round((row[PRICE] - prev_year_price) / prev_year_price * 100, 1)
+        else:
+            row[YOY] = None
+
+    def summary(self) -> Dict[str, Any]:
+        """Métricas de la última factura para los sensores (sin recorrer la serie)."""
+        if not self.rows:
+            return {}
+        last = self.rows[-1]
+        return {
+            "period": _month_label(last[MONTH]),
+            "invoice": last[ID],
+            "amount": last[AMOUNT],
+            "consumption": last[KWH],
+            "price": last[PRICE],
+            "avg_3m": last[AVG_3M],
+            "avg_12m": last[AVG_12M],
+            "yoy_pct": last[YOY],
+            "invoices": len(self.rows),
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"rows": self.rows}
+
+
+class InvoiceHistory:
+    """Histórico persistente de facturas por entrada de configuración."""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self._store: Store = Store(hass, HISTORY_STORAGE_VERSION, f"{DOMAIN}.{entry_id}.invoices")
+        self._series: Dict[str, ContractInvoiceSeries] = {}
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+
+    async def async_load(self) -> None:
+        stored = await self._store.async_load() or {}
+        self._series = {cid: ContractInvoiceSeries(s) for cid, s in stored.items()}
+
+    def add(self, data: Dict[str, Any]) -> None:
+        """Incorpora las facturas del refresco y anota `invoice_stats` en cada contrato."""
+        changed = False
+        for contract_id, payload in data.items():
+            series = self._series.setdefault(contract_id, ContractInvoiceSeries())
+            added = series.add(payload.get("invoices"))
+            changed |= added
+            if added or contract_id not in self._summaries:
+                self._summaries[contract_id] = series.summary()
+            payload["invoice_stats"] = self._summaries[contract_id]
+        if changed:
+            self._store.async_delay_save(self._data_to_save, HISTORY_SAVE_DELAY)
+
+    def _data_to_save(self) -> Dict[str, Any]:
+        return {cid: s.as_dict() for cid, s in self._series.items()}
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
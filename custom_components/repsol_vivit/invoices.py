@@ -0,0 +1,170 @@
+"""Descarga de documentos de factura con caché en disco direccionada por contenido.
+
+Los PDFs se guardan como `<sha256>.pdf` bajo `/config/repsol_vivit/invoices` y
+un `index.json` relaciona contrato/factura con su hash. Una factura ya indexada
+cuyo fichero existe no se vuelve a pedir; dos facturas con el mismo contenido
+comparten fichero.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from homeassistant.core import HomeAssistant
+
+from .api import RepsolLuzYGasAPI
+from .const import INVOICE_DOWNLOAD_CONCURRENCY, INVOICES_DIR, LOGGER
+
+INDEX_FILE = "index.json"
+
+# El índice es compartido por todas las entradas; se reescribe desde el executor
+_INDEX_LOCK = threading.Lock()
+
+
+def invoice_id(invoice: Dict[str, Any]) -> Optional[str]:
+    """Identificador de una factura del listado de INVOICES_URL."""
+    for key in ("code", "id", "invoiceId", "invoiceNumber", "number"):
+        if invoice.get(key):
+            return str(invoice[key])
+    return None
+
+
+class InvoiceDownloader:
+    """Descarga facturas de una entrada con concurrencia acotada.
+
+    Hay uno por entrada (en su store): el semáforo limita todas las llamadas al
+    servicio a la vez y una factura que ya se está descargando no se pide dos
+    veces; las llamadas que se solapan esperan a la misma descarga.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        client: RepsolLuzYGasAPI,
+        concurrency: int = INVOICE_DOWNLOAD_CONCURRENCY,
+    ) -> None:
+        self.hass = hass
+        self.client = client
+        self.base_dir = Path(hass.config.path(INVOICES_DIR))
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def async_download(
+        self, house_id: str, contract_id: str, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Descarga las facturas que falten y devuelve el estado de cada una."""
+        invoices = await self.client.async_get_invoices(house_id, contract_id)
+        if isinstance(invoices, dict):
+            invoices = [invoices]
+        invoices = [inv for inv in (invoices or []) if invoice_id(inv)]
+        if limit:
+            invoices = invoices[:limit]
+
+        index = await self.hass.async_add_executor_job(self._load_index)
+        known: Dict[str, Any] = index.get(contract_id) or {}
+        existing = await self.hass.async_add_executor_job(self._existing_blobs)
+
+        results: List[Dict[str, Any]] = []
+        pending = []
+        for inv in invoices:
+            iid = invoice_id(inv)
+            entry = known.get(iid)
+            if entry and entry.get("sha256") in existing:
+                results.append({"invoice_id": iid, "file": str(self.base_dir / entry["file"]), "status": "cached"})
+            else:
+                pending.append(iid)
+
+        downloaded = await asyncio.gather(
+            *(self._download_shared(house_id, contract_id, iid) for iid in pending),
+            return_exceptions=True,
+        )
+
+        new_entries: Dict[str, Dict[str, Any]] = {}
+        for iid, res in zip(pending, downloaded):
+            if isinstance(res, BaseException):
+                LOGGER.warning("No se pudo descargar la factura %s de %s: %s", iid, contract_id, res)
+                results.append({"invoice_id": iid, "status": "error", "error": str(res)})
+                continue
+            new_entries[iid] = res
+            results.append({"invoice_id": iid, "file": str(self.base_dir / res["file"]), "status": "downloaded"})
+
+        if new_entries:
+            await self.hass.async_add_executor_job(self._update_index, contract_id, new_entries)
+        return results
+
+    def _download_shared(self, house_id: str, contract_id: str, iid: str) -> "asyncio.Future[Dict[str, Any]]":
+        key = (contract_id, iid)
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = self._inflight[key] = asyncio.ensure_future(self._download_one(house_id, contract_id, iid))
+            fut.add_done_callback(lambda _fut: self._inflight.pop(key, None))
+        # shield: cancelar una llamada no corta la descarga que comparten otras
+        return asyncio.shield(fut)
+
+    async def _download_one(self, house_id: str, contract_id: str, iid: str) -> Dict[str, Any]:
+        async with self._semaphore:
+            digest = hashlib.sha256()
+            fh = await self.hass.async_add_executor_job(self._open_tmp, f".{contract_id}_{iid}.")
+
+            async def _sink(chunk: bytes) -> None:
+                digest.update(chunk)
+                await self.hass.async_add_executor_job(fh.write, chunk)
+
+            try:
+                size = await self.client.async_download_invoice(house_id, contract_id, iid, _sink)
+            except BaseException:
+                await self.hass.async_add_executor_job(self._discard, fh)
+                raise
+            sha = digest.hexdigest()
+            name = f"{sha}.pdf"
+            await self.hass.async_add_executor_job(self._commit, fh, self.base_dir / name)
+            return {"sha256": sha, "file": name, "size": size}
+
+    # ---------------- helpers de disco (executor) ----------------
+
+    def _open_tmp(self, prefix: str):
+        """Temporal propio de cada descarga (nunca compartido entre descargas)."""
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=self.base_dir, prefix=prefix, suffix=".part", delete=False)
+
+    @staticmethod
+    def _discard(fh) -> None:
+        fh.close()
+        Path(fh.name).unlink(missing_ok=True)
+
+    @staticmethod
+    def _commit(fh, target: Path) -> None:
+        fh.close()
+        tmp = Path(fh.name)
+        if target.exists():
+            # Mismo contenido ya en caché con otro identificador
+            tmp.unlink(missing_ok=True)
+        else:
+            os.replace(tmp, target)
+
+    def _existing_blobs(self) -> set[str]:
+        if not self.base_dir.is_dir():
+            return set()
+        return {p.stem for p in self.base_dir.glob("*.pdf")}
+
+    def _load_index(self) -> Dict[str, Any]:
+        try:
+            with open(self.base_dir / INDEX_FILE, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _update_index(self, contract_id: str, entries: Dict[str, Dict[str, Any]]) -> None:
+        with _INDEX_LOCK:
+            index = self._load_index()
+            index.setdefault(contract_id, {}).update(entries)
+            tmp = self.base_dir / f".{INDEX_FILE}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.base_dir / INDEX_FILE)
@@ -0,0 +1,168 @@
+"""Perfilado bajo demanda de un ciclo de refresco.
+
+Solo se activa al llamar al servicio `repsol_vivit.profile_refresh`; fuera de
+esa llamada no hay profiler, tracemalloc ni muestreo del event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.update_coordinator import UpdateFailed
+
+from .const import LOGGER, PROFILE_DIR, PROFILE_LAG_INTERVAL, PROFILE_TOP_N
+
+_LOCK = asyncio.Lock()
+
+
+class LoopLagSampler:
+    """Mide el retraso del event loop durmiendo `interval` y comparando."""
+
+    def __init__(self, interval: float = PROFILE_LAG_INTERVAL) -> None:
+        self.interval = interval
+        self.samples = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            self.samples += 1
+            self.total += lag
+            self.max = max(self.max, lag)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "samples": self.samples,
+            "mean_ms": round(self.total / self.samples * 1000, 2) if self.samples else None,
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+async def async_profile_refresh(hass: HomeAssistant, entry_id: str, store: Dict[str, Any]) -> Dict[str, Any]:
+    """Ejecuta un refresco (fetch + fan-out a entidades) bajo cProfile y tracemalloc."""
+    if _LOCK.locked():
+        raise HomeAssistantError("Ya hay un perfilado en curso")
+
+    async with _LOCK:
+        coordinator = store["coordinator"]
+        profiler = cProfile.Profile()
+        sampler = LoopLagSampler()
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(10)
+
+        sampler.start()
+        t0 = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError as e:  # otro profiler activo
+            await sampler.stop()
+            if started_tracemalloc:
+                tracemalloc.stop()
+            raise HomeAssistantError(f"No se puede perfilar: {e}") from e
+        try:
+            # Mismo camino que el coordinator: _update (fetch + histórico) y
+            # después el reparto a las entidades suscritas
+            try:
+                data = await coordinator.update_method()
+            except UpdateFailed as e:
+                raise HomeAssistantError(f"El refresco ha fallado: {e}") from e
+            t_fetch = time.perf_counter()
+            coordinator.async_set_updated_data(data)
+            t_fanout = time.perf_counter()
+        except BaseException:
+            if started_tracemalloc:
+                tracemalloc.stop()
+            raise
+        finally:
+            profiler.disable()
+            await sampler.stop()
+
+        # Recorrer las trazas puede tardar con mucha memoria: fuera del loop
+        snapshot = await hass.async_add_executor_job(_take_snapshot, started_tracemalloc)
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        out_dir = Path(hass.config.path(PROFILE_DIR))
+        summary = {
+            "entry_id": entry_id,
+            "contracts": len(data or {}),
+            "fetch_s": round(t_fetch - t0, 4),
+            "fan_out_s": round(t_fanout - t_fetch, 4),
+            "loop_lag": sampler.as_dict(),
+            "refresh_stats": store.get("refresh_stats"),
+        }
+        paths = await hass.async_add_executor_job(
+            _write_results, out_dir, f"refresh-{stamp}", profiler, snapshot, summary
+        )
+        summary.update(paths)
+        LOGGER.info("Perfil de refresco guardado en %s", paths["profile"])
+        return summary
+
+
+def _take_snapshot(stop: bool) -> tracemalloc.Snapshot:
+    """Instantánea de tracemalloc (executor); lo detiene si lo arrancó el perfilado."""
+    snapshot = tracemalloc.take_snapshot()
+    if stop:
+        tracemalloc.stop()
+    return snapshot
+
+
+def _top_allocations(snapshot: tracemalloc.Snapshot) -> List[Dict[str, Any]]:
+    stats = snapshot.filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen *>"))
+    ).statistics("lineno")
+    return [
+        {"where": str(s.traceback[0]), "size_kib": round(s.size / 1024, 1), "count": s.count}
+        for s in stats[:PROFILE_TOP_N]
+    ]
+
+
+def _write_results(
+    out_dir: Path,
+    name: str,
+    profiler: cProfile.Profile,
+    snapshot: tracemalloc.Snapshot,
+    summary: Dict[str, Any],
+) -> Dict[str, str]:
+    """Escribe .prof y resumen (executor)."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    prof_path = out_dir / f"{name}.prof"
+    summary_path = out_dir / f"{name}.json"
+    profiler.dump_stats(prof_path)
+
+    buf = io.StringIO()
+    pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {**summary, "top_allocations": _top_allocations(snapshot), "top_cumulative": buf.getvalue()},
+            f,
+            indent=1,
+        )
+    return {"profile": str(prof_path), "summary": str(summary_path)}
@@ -0,0 +1,291 @@
+"""Grabación y reproducción del tráfico HTTP del cliente.
+
+`RecordingSession` envuelve la sesión aiohttp del cliente y guarda cada
+petición/respuesta (login, /houses, facturas, costes, estimación y batería
+virtual) en un archivo JSONL comprimido con gzip. Antes de escribir se
+limpian los datos sensibles: no se guardan cabeceras ni cuerpos de petición
+(credenciales, UID, firmas, cookies) y en las respuestas se sustituyen tokens,
+datos personales y CUPS (por un seudónimo estable dentro del archivo). Solo
+se guardan cuerpos JSON ya limpios; de los demás (texto, binarios) y de los
+documentos de factura, que se sirven en streaming sin leerlos, solo quedan el
+estado y el tamaño.
+
+`ReplaySession` sirve ese archivo al mismo cliente sin red, con las latencias
+originales o lo más rápido posible.
+
+Sin dependencias de Home Assistant.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import re
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+from multidict import CIMultiDict, CIMultiDictProxy
+
+ARCHIVE_VERSION = 1
+
+# Cabeceras de respuesta que se conservan (validadores/caché y tipo)
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control", "Expires", "Date")
+
+TOKEN_KEYS = {"UID", "UIDSignature", "signatureTimestamp", "id_token", "login_token", "cookieValue"}
+PERSONAL_KEYS = {
+    "email", "loginID", "loginIDs", "emails", "firstName", "lastName", "nickname", "fullName",
+    "phone", "phoneNumber", "phones", "nif", "dni", "documentNumber", "iban", "accountNumber",
+    "address", "street", "profile", "sessionInfo",
+}
+CUPS_RE = re.compile(r"ES\d{16}[A-Z]{2}(?:\d[A-Z])?")
+
+# Ruta de INVOICE_DOCUMENT_URL: PDF sin anonimizar, no se graban
+_DOCUMENT_PATH_RE = re.compile(r"/invoices/[^/]+/pdf$")
+
+
+class _Scrubber:
+    """Limpia cuerpos JSON; los CUPS se cambian por un seudónimo estable."""
+
+    def __init__(self) -> None:
+        self._cups: Dict[str, str] = {}
+
+    def _pseudo_cups(self, match: "re.Match[str]") -> str:
+        return self.pseudo_cups(match.group(0))
+
+    def pseudo_cups(self, real: str) -> str:
+        if real not in self._cups:
+            digits = int(hashlib.sha256(real.encode()).hexdigest(), 16) % 10**16
+            self._cups[real] = f"ES{digits:016d}XX"
+        return self._cups[real]
+
+    def scrub(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            out: Dict[str, Any] = {}
+            for k, v in value.items():
+                if k in TOKEN_KEYS:
+                    out[k] = "REDACTED" if v else v
+                elif k in PERSONAL_KEYS:
+                    out[k] = "***" if v else v
+                elif k.lower() == "cups" and isinstance(v, str) and v:
+                    out[k] = self.pseudo_cups(v)
+                else:
+                    out[k] = self.scrub(v)
+            return out
+        if isinstance(value, list):
+            return [self.scrub(v) for v in value]
+        if isinstance(value, str):
+            return CUPS_RE.sub(self._pseudo_cups, value)
+        return value
+
+    def scrub_body(self, body: bytes) -> Tuple[str, Any]:
+        """(campo, contenido) para el archivo: JSON limpio o solo el tamaño."""
+        try:
+            text = body.decode("utf-8")
+            parsed = json.loads(text) if text.strip() else None
+        except ValueError:  # UnicodeDecodeError incluido: no se puede limpiar
+            return "body_omitted", len(body)
+        return "body", json.dumps(self.scrub(parsed), ensure_ascii=False, separators=(",", ":"))
+
+
+class _Content:
+    def __init__(self, body: bytes) -> None:
+        self._body = body
+
+    async def iter_chunked(self, n: int) -> AsyncIterator[bytes]:
+        for i in range(0, len(self._body), n):
+            yield self._body[i:i + n]
+
+
+class BufferedResponse:
+    """Respuesta ya leída con la interfaz de `aiohttp.ClientResponse` que usa el cliente."""
+
+    def __init__(self, status: int, headers: Mapping[str, str], body: bytes) -> None:
+        self.status = status
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self._body = body
+        self.content = _Content(body)
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self) -> str:
+        return self._body.decode("utf-8", errors="replace")
+
+    async def json(self, content_type: Optional[str] = None) -> Any:
+        return json.loads(self._body) if self._body.strip() else None
+
+    async def __aenter__(self) -> "BufferedResponse":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+
+class _Request:
+    """Context manager asíncrono devuelto por get()/post() de las sesiones envoltorio."""
+
+    def __init__(self, coro) -> None:
+        self._coro = coro
+
+    async def __aenter__(self) -> BufferedResponse:
+        return await self._coro
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+
+class _PassThrough:
+    """Petición sin grabar el cuerpo: la respuesta real llega en streaming."""
+
+    def __init__(self, owner: "RecordingSession", method: str, url: str, kwargs: Dict[str, Any]) -> None:
+        self._owner = owner
+        self._args = (method, url, kwargs)
+        self._cm: Any = None
+
+    async def __aenter__(self) -> Any:
+        method, url, kwargs = self._args
+        t0 = time.monotonic()
+        self._cm = self._owner.session.request(method, url, **kwargs)
+        r = await self._cm.__aenter__()
+        headers = {h: r.headers[h] for h in KEPT_HEADERS if h in r.headers}
+        self._owner._append(t0, method, url, r.status, headers, "body_omitted", r.content_length)
+        return r
+
+    async def __aexit__(self, *exc: Any) -> Any:
+        return await self._cm.__aexit__(*exc)
+
+
+class RecordingSession:
+    """Envuelve una `aiohttp.ClientSession` y graba el tráfico en `path`."""
+
+    def __init__(self, session, path: Path) -> None:
+        self.session = session
+        self.path = Path(path)
+        self._scrubber = _Scrubber()
+        self._start = time.monotonic()
+        self._pending: List[str] = []
+        self._flush_task: Optional[asyncio.Future] = None
+        self._header_written = False
+
+    def get(self, url: str, **kwargs: Any) -> Any:
+        if _DOCUMENT_PATH_RE.search(urlsplit(url).path):
+            return _PassThrough(self, "GET", url, kwargs)
+        return _Request(self._record("GET", url, kwargs))
+
+    def post(self, url: str, **kwargs: Any) -> _Request:
+        return _Request(self._record("POST", url, kwargs))
+
+    async def _record(self, method: str, url: str, kwargs: Dict[str, Any]) -> BufferedResponse:
+        t0 = time.monotonic()
+        async with self.session.request(method, url, **kwargs) as r:
+            body = await r.read()
+            status = r.status
+            headers = {h: r.headers[h] for h in KEPT_HEADERS if h in r.headers}
+        self._append(t0, method, url, status, headers, *self._scrubber.scrub_body(body))
+        return BufferedResponse(status, headers, body)
+
+    def _append(
+        self, t0: float, method: str, url: str, status: int, headers: Dict[str, str], field: str, content: Any
+    ) -> None:
+        self._pending.append(json.dumps({
+            "t": round(t0 - self._start, 4),
+            "dur": round(time.monotonic() - t0, 4),
+            "method": method,
+            "url": CUPS_RE.sub(self._scrubber._pseudo_cups, url),
+            "status": status,
+            "headers": headers,
+            field: content,
+        }, ensure_ascii=False, separators=(",", ":")))
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            loop = asyncio.get_running_loop()
+            self._flush_task = loop.run_in_executor(None, self._flush)
+
+    def _flush(self) -> None:
+        """Escribe lo pendiente (executor); repite si llegó más mientras escribía."""
+        while self._pending:
+            lines, self._pending = self._pending, []
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # gzip admite miembros concatenados: cada flush añade uno
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                if not self._header_written:
+                    f.write(json.dumps({"version": ARCHIVE_VERSION, "created": time.time()}) + "\n")
+                    self._header_written = True
+                f.write("\n".join(lines) + "\n")
+
+    async def async_close(self) -> None:
+        """Vuelca lo pendiente (no cierra la sesión envuelta)."""
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._pending:
+            await asyncio.get_running_loop().run_in_executor(None, self._flush)
+
+
+def load_archive(path: Path) -> List[Dict[str, Any]]:
+    """Registros de un archivo (sin la cabecera)."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r for r in records if "method" in r]
+
+
+class ReplaySession:
+    """Sirve un archivo grabado con la interfaz de sesión que usa el cliente.
+
+    Las respuestas se entregan por (método, URL) en el orden grabado; si se
+    piden más veces de las grabadas se repite la última. Un 304 grabado solo se
+    sirve a peticiones condicionales; al resto se les da el último 200. Con
+    `realtime` se espera la latencia original de cada petición.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], realtime: bool = True) -> None:
+        self.realtime = realtime
+        self._queues: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = defaultdict(deque)
+        # Última respuesta completa por petición, para peticiones sin validadores
+        self._last_ok: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for rec in records:
+            key = (rec["method"], rec["url"])
+            self._queues[key].append(rec)
+            if rec["status"] == 200:
+                self._last_ok.setdefault(key, rec)
+        self.requests = 0
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path: Path, realtime: bool = True) -> "ReplaySession":
+        return cls(load_archive(path), realtime)
+
+    def get(self, url: str, **kwargs: Any) -> _Request:
+        return _Request(self._replay("GET", url, kwargs.get("headers")))
+
+    def post(self, url: str, **kwargs: Any) -> _Request:
+        return _Request(self._replay("POST", url, kwargs.get("headers")))
+
+    async def _replay(self, method: str, url: str, headers: Optional[Mapping[str, str]]) -> BufferedResponse:
+        self.requests += 1
+        key = (method, url)
+        queue = self._queues.get(key)
+        if not queue:
+            self.misses += 1
+            return BufferedResponse(404, {"Content-Type": "text/plain"}, b"not recorded")
+        rec = queue.popleft() if len(queue) > 1 else queue[0]
+        conditional = bool(headers) and ("If-None-Match" in headers or "If-Modified-Since" in headers)
+        if rec["status"] == 304 and not conditional and key in self._last_ok:
+            rec = {**self._last_ok[key], "dur": rec.get("dur")}
+        elif rec["status"] == 200:
+            self._last_ok[key] = rec
+        if self.realtime and rec.get("dur"):
+            await asyncio.sleep(rec["dur"])
+        if "body_b64" in rec:  # archivos antiguos
+            body = base64.b64decode(rec["body_b64"])
+        elif "body_omitted" in rec:
+            body = b""
+        else:
+            body = (rec.get("body") or "").encode("utf-8")
+        return BufferedResponse(rec["status"], rec.get("headers") or {}, body)
@@ -1,60 +1,417 @@
 """Sensors for Vivit Energy Portal (Unofficial)."""
 from __future__ import annotations
 
-import re
-from typing import Any, Dict, List, Optional
-
-from homeassistant.components.sensor import SensorEntity, SensorDeviceClass
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
+from .account import AccountAggregate
 from .const import DOMAIN, LOGGER
 
+ALL_TYPES = frozenset({"ELECTRICITY", "GAS"})
+ELECTRICITY_ONLY = frozenset({"ELECTRICITY"})
+
+
+@dataclass(frozen=True, kw_only=True)
+class VivitSensorEntityDescription(SensorEntityDescription):
+    """Descripción de sensor de contrato.
+
+    `value_fn` recibe el payload del contrato en el coordinator y el contrato
+    ya fusionado (house_contract sobre contract_info).
+    """
+
+    value_fn: Callable[[Dict[str, Any], Dict[str, Any]], Any]
+    attrs_fn: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = None
+    contract_types: frozenset[str] = ALL_TYPES
+    price_per_kwh: bool = False
+
+
+@dataclass(frozen=True, kw_only=True)
+class VivitVBSensorEntityDescription(SensorEntityDescription):
+    """Descripción de sensor de batería virtual.
+
+    `value_fn` recibe el histórico de batería virtual (o el snapshot del último
+    canje en los sensores de cupón) y el contract_id.
+    """
+
+    value_fn: Callable[[Dict[str, Any], str], Any]
+    price_per_kwh: bool = False
+
+
+@dataclass(frozen=True, kw_only=True)
+class VivitAccountSensorEntityDescription(SensorEntityDescription):
+    """Descripción de sensor de cuenta; `value_fn` recibe los totales de account.py."""
+
+    value_fn: Callable[[Dict[str, Any]], Any]
+    price_per_kwh: bool = False
+
+
+# ---------------- value functions ----------------
+
+def _costs(key: str) -> Callable[[Dict[str, Any], Dict[str, Any]], Any]:
+    return lambda data, contract: (data.get("costs") or {}).get(key)
+
+
+def _next_invoice(key: str) -> Callable[[Dict[str, Any], Dict[str, Any]], Any]:
+    return lambda data, contract: (data.get("nextInvoice") or {}).get(key)
+
+
+def _trend(key: str) -> Callable[[Dict[str, Any], Dict[str, Any]], Any]:
+    return lambda data, contract: (data.get("trend") or {}).get(key)
+
+
+def _trend_attrs(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    trend = data.get("trend") or {}
+    if not trend:
+        return None
+    return {
+        "cycle_length_days": trend.get("cycle_length"),
+        "consumption_cycle_average": trend.get("consumption_cycle_average"),
+        "consumption_trend_pct": trend.get("consumption_trend_pct"),
+        "history_points": trend.get("points"),
+    }
+
+
+def _vb_rollup(period: str, metric: str) -> Callable[[Dict[str, Any], Dict[str, Any]], Any]:
+    return lambda data, contract: ((data.get("vb_rollup") or {}).get(period) or {}).get(metric)
+
+
+def _vb_rollup_attrs(period: str, metric: str) -> Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Periodo actual e histórico de la métrica (12 meses o todos los años)."""
+    def _attrs(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        rollup = data.get("vb_rollup") or {}
+        if period not in rollup:
+            return None
+        return {
+            "period": rollup[period]["period"],
+            "history": {p: v[metric] for p, v in rollup[f"{period}s"].items()},
+        }
+    return _attrs
+
+
+def _invoice_stat(key: str) -> Callable[[Dict[str, Any], Dict[str, Any]], Any]:
+    return lambda data, contract: (data.get("invoice_stats") or {}).get(key)
+
+
+def _invoice_stats_attrs(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    stats = data.get("invoice_stats") or {}
+    if not stats:
+        return None
+    return {
+        "period": stats.get("period"),
+        "invoice": stats.get("invoice"),
+        "invoice_amount": stats.get("amount"),
+        "invoice_consumption": stats.get("consumption"),
+        "invoices_in_history": stats.get("invoices"),
+    }
+
+
+def _contract_field(key: str) -> Callable[[Dict[str, Any], Dict[str, Any]], Any]:
+    return lambda data, contract: contract.get(key)
+
+
+def _last_invoice(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    inv = data.get("invoices")
+    if isinstance(inv, list) and inv:
+        return inv[0]
+    if isinstance(inv, dict):
+        return inv
+    return None
+
+
+def _last_invoice_amount(data: Dict[str, Any], contract: Dict[str, Any]) -> Any:
+    obj = _last_invoice(data)
+    if not obj:
+        return None
+    return obj.get("amount") or obj.get("totalAmount")
+
+
+def _last_invoice_paid(data: Dict[str, Any], contract: Dict[str, Any]) -> str:
+    obj = _last_invoice(data)
+    return "Yes" if obj and obj.get("status") == "PAID" else "No"
+
+
+def _price(key: str) -> Callable[[Dict[str, Any], Dict[str, Any]], Any]:
+    """Precio ya parseado al normalizar /houses (api._normalize_house)."""
+    return lambda data, contract: (contract.get("parsedPrices") or {}).get(key)
+
+
+def _vb_contract(vb: Dict[str, Any], contract_id: str) -> Optional[Dict[str, Any]]:
+    discounts = vb.get("discounts") or {}
+    return next(
+        (c for c in (discounts.get("contracts") or []) if c.get("productCode") == contract_id),
+        None,
+    )
+
+
+def _vb_conversion_price(vb: Dict[str, Any]) -> Any:
+    excedents = vb.get("excedents") or {}
+    return next((d.get("conversionPrice") for d in (excedents.get("data") or [])), None)
+
+
+def _vb_pending_amount(vb: Dict[str, Any], contract_id: str) -> Any:
+    c = _vb_contract(vb, contract_id)
+    return c.get("pendingAmount") if c else None
+
+
+def _vb_kwh_available(vb: Dict[str, Any], contract_id: str) -> Any:
+    c = _vb_contract(vb, contract_id)
+    pending = c.get("pendingAmount") if c else 0
+    conv = _vb_conversion_price(vb)
+    try:
+        return round(float(pending) / float(conv), 2) if conv else None
+    except Exception:
+        return None
+
+
+def _vb_applied_amount(vb: Dict[str, Any], contract_id: str) -> Any:
+    return (vb.get("excedents") or {}).get("appliedAmount")
+
+
+def _vb_kwh_redeemed(vb: Dict[str, Any], contract_id: str) -> Any:
+    excedents = vb.get("excedents") or {}
+    conv = _vb_conversion_price(vb)
+    try:
+        return round(float(excedents.get("appliedAmount", 0)) / float(conv), 2) if conv else None
+    except Exception:
+        return None
+
+
+def _vb_total_kwh(vb: Dict[str, Any], contract_id: str) -> Any:
+    try:
+        return round(float((vb.get("excedents") or {}).get("totalkWh", 0)), 2)
+    except Exception:
+        return None
+
+
 # Sensores base (nombres LIMPIOS; el nombre del dispositivo es quien lleva "Contrato N (…)").
-SENSOR_DEFS = [
+# La `key` forma parte del unique_id: no cambiarla en sensores existentes.
+SENSOR_DESCRIPTIONS: tuple[VivitSensorEntityDescription, ...] = (
     # Comunes
-    {"name": "Consumo", "var": "consumption", "class": SensorDeviceClass.ENERGY},
-    {"name": "Días totales", "var": "totalDays", "class": None},
-    {"name": "Estado contrato", "var": "status", "class": None},
-    {"name": "Importe", "var": "amount", "class": SensorDeviceClass.MONETARY},
-    {"name": "Importe fijo", "var": "amountFixed", "class": SensorDeviceClass.MONETARY},
-    {"name": "Importe variable", "var": "amountVariable", "class": SensorDeviceClass.MONETARY},
-    {"name": "Promedio diario", "var": "averageAmount", "class": SensorDeviceClass.MONETARY},
-    {"name": "Última factura", "var": "lastInvoiceAmount", "class": SensorDeviceClass.MONETARY},
-    {"name": "Última factura pagada", "var": "lastInvoicePaid", "class": None},
-    {"name": "Próxima factura", "var": "nextInvoiceAmount", "class": SensorDeviceClass.MONETARY},
-    {"name": "Variable próxima factura", "var": "nextInvoiceVariableAmount", "class": SensorDeviceClass.MONETARY},
-    {"name": "Fijo próxima factura", "var": "nextInvoiceFixedAmount", "class": SensorDeviceClass.MONETARY},
+    VivitSensorEntityDescription(
+        key="consumption", name="Consumo",
+        device_class=SensorDeviceClass.ENERGY, native_unit_of_measurement="kWh",
+        value_fn=_costs("consumption"),
+    ),
+    VivitSensorEntityDescription(key="totalDays", name="Días totales", value_fn=_costs("totalDays")),
+    VivitSensorEntityDescription(key="status", name="Estado contrato", value_fn=_contract_field("status")),
+    VivitSensorEntityDescription(
+        key="amount", name="Importe",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_costs("amount"),
+    ),
+    VivitSensorEntityDescription(
+        key="amountFixed", name="Importe fijo",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_costs("amountFixed"),
+    ),
+    VivitSensorEntityDescription(
+        key="amountVariable", name="Importe variable",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_costs("amountVariable"),
+    ),
+    VivitSensorEntityDescription(
+        key="averageAmount", name="Promedio diario",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_costs("averageAmount"),
+    ),
+    VivitSensorEntityDescription(
+        key="lastInvoiceAmount", name="Última factura",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_last_invoice_amount,
+    ),
+    VivitSensorEntityDescription(
+        key="lastInvoicePaid", name="Última factura pagada", value_fn=_last_invoice_paid,
+    ),
+    VivitSensorEntityDescription(
+        key="nextInvoiceAmount", name="Próxima factura",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_next_invoice("amount"),
+    ),
+    VivitSensorEntityDescription(
+        key="nextInvoiceVariableAmount", name="Variable próxima factura",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_next_invoice("amountVariable"),
+    ),
+    VivitSensorEntityDescription(
+        key="nextInvoiceFixedAmount", name="Fijo próxima factura",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_next_invoice("amountFixed"),
+    ),
+
+    # Derivados del histórico local (history.py)
+    VivitSensorEntityDescription(
+        key="dailyCostRate", name="Coste diario (tendencia)",
+        device_class=SensorDeviceClass.MONETARY,
+        value_fn=_trend("daily_cost_rate"), attrs_fn=_trend_attrs,
+    ),
+    VivitSensorEntityDescription(
+        key="projectedBill", name="Factura proyectada",
+        device_class=SensorDeviceClass.MONETARY,
+        value_fn=_trend("projected_bill"), attrs_fn=_trend_attrs,
+    ),
+    VivitSensorEntityDescription(
+        key="consumptionTrend", name="Tendencia consumo",
+        native_unit_of_measurement="kWh/d", state_class=SensorStateClass.MEASUREMENT,
+        value_fn=_trend("consumption_trend"), attrs_fn=_trend_attrs,
+    ),
+
+    # Analítica de facturas (invoice_history.py): €/kWh de la última factura y comparativas
+    VivitSensorEntityDescription(
+        key="invoicePrice", name="Precio efectivo última factura",
+        device_class=SensorDeviceClass.MONETARY, price_per_kwh=True,
+        value_fn=_invoice_stat("price"), attrs_fn=_invoice_stats_attrs,
+    ),
+    VivitSensorEntityDescription(
+        key="invoicePriceAvg3m", name="Precio efectivo medio 3 meses",
+        device_class=SensorDeviceClass.MONETARY, price_per_kwh=True,
+        value_fn=_invoice_stat("avg_3m"), attrs_fn=_invoice_stats_attrs,
+    ),
+    VivitSensorEntityDescription(
+        key="invoicePriceAvg12m", name="Precio efectivo medio 12 meses",
+        device_class=SensorDeviceClass.MONETARY, price_per_kwh=True,
+        value_fn=_invoice_stat("avg_12m"), attrs_fn=_invoice_stats_attrs,
+    ),
+    VivitSensorEntityDescription(
+        key="invoicePriceYoY", name="Variación interanual precio efectivo",
+        native_unit_of_measurement="%",
+        value_fn=_invoice_stat("yoy_pct"), attrs_fn=_invoice_stats_attrs,
+    ),
 
     # Solo electricidad
-    {"name": "Potencia contratada", "var": "power", "class": SensorDeviceClass.POWER},
-    {"name": "Tarifa", "var": "fee", "class": None},
-    {"name": "Precio potencia punta", "var": "pricesPowerPunta", "class": SensorDeviceClass.MONETARY},
-    {"name": "Precio potencia valle", "var": "pricesPowerValle", "class": SensorDeviceClass.MONETARY},
-    {"name": "Precio energía", "var": "pricesEnergyAmount", "class": SensorDeviceClass.MONETARY},
-
-    # Solo gas
-    {"name": "Término fijo gas", "var": "fixedTerm", "class": SensorDeviceClass.MONETARY},
-    {"name": "Término variable gas", "var": "variableTerm", "class": SensorDeviceClass.MONETARY},
-]
+    VivitSensorEntityDescription(
+        key="power", name="Potencia contratada",
+        device_class=SensorDeviceClass.POWER, native_unit_of_measurement="kW",
+        contract_types=ELECTRICITY_ONLY, value_fn=_contract_field("power"),
+    ),
+    VivitSensorEntityDescription(
+        key="fee", name="Tarifa",
+        contract_types=ELECTRICITY_ONLY, value_fn=_contract_field("fee"),
+    ),
+    VivitSensorEntityDescription(
+        key="pricesPowerPunta", name="Precio potencia punta",
+        device_class=SensorDeviceClass.MONETARY,
+        contract_types=ELECTRICITY_ONLY, value_fn=_price("powerPunta"),
+    ),
+    VivitSensorEntityDescription(
+        key="pricesPowerValle", name="Precio potencia valle",
+        device_class=SensorDeviceClass.MONETARY,
+        contract_types=ELECTRICITY_ONLY, value_fn=_price("powerValle"),
+    ),
+    VivitSensorEntityDescription(
+        key="pricesEnergyAmount", name="Precio energía",
+        device_class=SensorDeviceClass.MONETARY, price_per_kwh=True,
+        contract_types=ELECTRICITY_ONLY, value_fn=_price("energy"),
+    ),
+
+    # Términos de gas (históricamente también se crean en electricidad; ahí quedan a None)
+    VivitSensorEntityDescription(
+        key="fixedTerm", name="Término fijo gas",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_price("gasFixed"),
+    ),
+    VivitSensorEntityDescription(
+        key="variableTerm", name="Término variable gas",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_price("gasVariable"),
+    ),
+)
 
 # Sensores de batería virtual (solo electricidad y solo si hay datos)
-VB_DEFS = [
-    {"name": "Batería virtual — € pendientes", "var": "pendingAmount", "class": SensorDeviceClass.MONETARY},
-    {"name": "Batería virtual — kWh disponibles", "var": "kwhAvailable", "class": SensorDeviceClass.ENERGY},
-    {"name": "Batería virtual — € canjeados", "var": "appliedAmount", "class": SensorDeviceClass.MONETARY},
-    {"name": "Batería virtual — kWh canjeados", "var": "kwhRedeemed", "class": SensorDeviceClass.ENERGY},
-    {"name": "Batería virtual — kWh totales", "var": "totalKWh", "class": SensorDeviceClass.ENERGY},
-    {"name": "Batería virtual — precio excedentes", "var": "excedentsPrice", "class": SensorDeviceClass.MONETARY},
-]
+VB_DESCRIPTIONS: tuple[VivitVBSensorEntityDescription, ...] = (
+    VivitVBSensorEntityDescription(
+        key="pendingAmount", name="Batería virtual — € pendientes",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_vb_pending_amount,
+    ),
+    VivitVBSensorEntityDescription(
+        key="kwhAvailable", name="Batería virtual — kWh disponibles",
+        device_class=SensorDeviceClass.ENERGY, native_unit_of_measurement="kWh",
+        value_fn=_vb_kwh_available,
+    ),
+    VivitVBSensorEntityDescription(
+        key="appliedAmount", name="Batería virtual — € canjeados",
+        device_class=SensorDeviceClass.MONETARY, value_fn=_vb_applied_amount,
+    ),
+    VivitVBSensorEntityDescription(
+        key="kwhRedeemed", name="Batería virtual — kWh canjeados",
+        device_class=SensorDeviceClass.ENERGY, native_unit_of_measurement="kWh",
+        value_fn=_vb_kwh_redeemed,
+    ),
+    VivitVBSensorEntityDescription(
+        key="totalKWh", name="Batería virtual — kWh totales",
+        device_class=SensorDeviceClass.ENERGY, native_unit_of_measurement="kWh",
+        value_fn=_vb_total_kwh,
+    ),
+    VivitVBSensorEntityDescription(
+        key="excedentsPrice", name="Batería virtual — precio excedentes",
+        device_class=SensorDeviceClass.MONETARY, price_per_kwh=True,
+        value_fn=lambda vb, contract_id: _vb_conversion_price(vb),
+    ),
+)
+
+# Agregados de batería virtual por mes/año (vbrollup.py); el periodo es el último con datos
+VB_ROLLUP_DESCRIPTIONS: tuple[VivitSensorEntityDescription, ...] = tuple(
+    VivitSensorEntityDescription(
+        key=f"vb{metric_key}{period.capitalize()}",
+        name=f"Batería virtual — {label} ({'mes' if period == 'month' else 'año'})",
+        device_class=device_class, native_unit_of_measurement=unit, price_per_kwh=metric == "price",
+        contract_types=ELECTRICITY_ONLY,
+        value_fn=_vb_rollup(period, metric), attrs_fn=_vb_rollup_attrs(period, metric),
+    )
+    for period in ("month", "year")
+    for metric, metric_key, label, device_class, unit in (
+        ("kwh_in", "KwhIn", "kWh vertidos", SensorDeviceClass.ENERGY, "kWh"),
+        ("credited", "Credited", "€ acumulados", SensorDeviceClass.MONETARY, None),
+        ("redeemed", "Redeemed", "€ canjeados", SensorDeviceClass.MONETARY, None),
+        ("price", "Price", "precio efectivo", SensorDeviceClass.MONETARY, None),
+    )
+)
+
+# Sensores del último canje: leen del snapshot del cupón, no del histórico
+VB_COUPON_DESCRIPTIONS: tuple[VivitVBSensorEntityDescription, ...] = (
+    VivitVBSensorEntityDescription(
+        key="amount", name="Batería virtual — último importe canjeado",
+        device_class=SensorDeviceClass.MONETARY,
+        value_fn=lambda coupon, contract_id: coupon.get("amount"),
+    ),
+    VivitVBSensorEntityDescription(
+        key="kWh", name="Batería virtual — últimos kWh canjeados",
+        device_class=SensorDeviceClass.ENERGY, native_unit_of_measurement="kWh",
+        value_fn=lambda coupon, contract_id: coupon.get("kWh"),
+    ),
+)
+
+
+# Totales de la cuenta (todas las entradas del mismo usuario), en un dispositivo propio
+ACCOUNT_DESCRIPTIONS: tuple[VivitAccountSensorEntityDescription, ...] = (
+    VivitAccountSensorEntityDescription(
+        key="totalCost", name="Cuenta — coste acumulado total",
+        device_class=SensorDeviceClass.MONETARY,
+        value_fn=lambda totals: totals.get("total_cost"),
+    ),
+    VivitAccountSensorEntityDescription(
+        key="totalNextInvoice", name="Cuenta — próxima factura total",
+        device_class=SensorDeviceClass.MONETARY,
+        value_fn=lambda totals: totals.get("total_next_invoice"),
+    ),
+    VivitAccountSensorEntityDescription(
+        key="totalProjectedBill", name="Cuenta — factura proyectada total",
+        device_class=SensorDeviceClass.MONETARY,
+        value_fn=lambda totals: totals.get("total_projected_bill"),
+    ),
+    VivitAccountSensorEntityDescription(
+        key="batteryBalance", name="Cuenta — saldo batería virtual",
+        device_class=SensorDeviceClass.MONETARY,
+        value_fn=lambda totals: totals.get("battery_balance"),
+    ),
+)
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities):
     """Crea sensores a partir del coordinator."""
     stored = hass.data[DOMAIN][entry.entry_id]
     coordinator = stored["coordinator"]
+    currency = hass.config.currency
 
     # En nuestra rama actual, __init__.py guarda estos campos por entrada:
     # - contract_id, contract_type, device_name
@@ -65,10 +422,15 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
 
     data: Dict[str, Dict[str, Any]] = coordinator.data or {}
     entities: List[SensorEntity] = []
+    house_contracts = _house_contract_index(data)
 
     if contract_id and contract_id in data:
         # Creación modo 1-contrato (preferido)
-        entities.extend(_build_contract_entities(data, contract_id, device_name, contract_type, coordinator))
+        entities.extend(
+            _build_contract_entities(
+                data, contract_id, device_name, contract_type, coordinator, currency, house_contracts
+            )
+        )
     else:
         # Fallback: crear para todos los contratos del payload
         for cid in list(data.keys()):
@@ -76,15 +438,47 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
             cinfo = payload.get("contracts") or {}
             ctype = (cinfo.get("contractType") or "ELECTRICITY").upper()
             dev_name = f"Contrato (Auto) ({'Electricidad' if ctype == 'ELECTRICITY' else 'Gas'})"
-            entities.extend(_build_contract_entities(data, cid, dev_name, ctype, coordinator))
+            entities.extend(
+                _build_contract_entities(data, cid, dev_name, ctype, coordinator, currency, house_contracts)
+            )
 
     if not entities:
         LOGGER.error("No se han podido crear entidades: datos insuficientes.")
         return
 
-    async_add_entities(entities, True)
+    # Los datos ya están en el coordinator (first refresh): sin update_before_add
+    async_add_entities(entities)
     LOGGER.info("Añadidas %s entidades de sensor", len(entities))
 
+    # Sensores de cuenta: los crea una sola entrada del usuario (ver account.py)
+    account: Optional[AccountAggregate] = stored.get("account")
+    if account is not None:
+        account.register_platform(
+            entry.entry_id,
+            lambda: async_add_entities(
+                [VivitAccountSensor(account, description, currency) for description in ACCOUNT_DESCRIPTIONS]
+            ),
+        )
+
+
+def _house_contract_index(full_data: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """code -> contrato de /houses, recorriendo cada vivienda una sola vez.
+
+    Los contratos de una misma vivienda comparten el objeto `house_data`
+    (memo por ciclo del cliente), así que se indexa por identidad.
+    """
+    index: Dict[str, Dict[str, Any]] = {}
+    seen: set[int] = set()
+    for payload in full_data.values():
+        house_data = payload.get("house_data") or {}
+        if id(house_data) in seen:
+            continue
+        seen.add(id(house_data))
+        for c in house_data.get("contracts") or []:
+            if c.get("code") is not None:
+                index.setdefault(c["code"], c)
+    return index
+
 
 def _build_contract_entities(
     full_data: Dict[str, Dict[str, Any]],
@@ -92,18 +486,27 @@ def _build_contract_entities(
     device_name: str,
     contract_type: str | None,
     coordinator,
+    currency: str,
+    house_contracts: Optional[Dict[str, Dict[str, Any]]] = None,
 ) -> List[SensorEntity]:
-    """Construye todas las entidades para un contrato."""
+    """Construye todas las entidades para un contrato.
+
+    `house_contracts` es el índice de `_house_contract_index`; si no se pasa
+    se construye solo con la vivienda de este contrato.
+    """
     entities: List[SensorEntity] = []
 
     payload = full_data.get(contract_id) or {}
     cinfo = payload.get("contracts") or {}
-    cups = cinfo.get("cups") or contract_id
     house_id = cinfo.get("house_id")
 
-    house_data = payload.get("house_data") or {}
-    house_contracts = house_data.get("contracts") or []
-    house_contract = next((c for c in house_contracts if c.get("code") == contract_id), {})
+    if house_contracts is None:
+        house_contracts = _house_contract_index({contract_id: payload})
+    house_contract = house_contracts.get(contract_id) or {}
+
+    # Los campos del contrato en /houses tienen prioridad sobre los del listado
+    contract = dict(cinfo)
+    contract.update({k: v for k, v in house_contract.items() if v})
 
     ctype = (contract_type or cinfo.get("contractType") or "ELECTRICITY").upper()
 
@@ -117,78 +520,48 @@ def _build_contract_entities(
     )
 
     # Sensores base
-    for sd in SENSOR_DEFS:
-        var = sd["var"]
-        # Filtro tipo
-        if ctype == "ELECTRICITY" and var in {"fixedTerm", "variableTerm"}:
-            pass  # OK (no los creamos para electricidad)
-        elif ctype == "GAS" and var in {"power", "fee", "pricesPowerPunta", "pricesPowerValle", "pricesEnergyAmount"}:
-            continue  # no aplican a gas
-
+    for description in SENSOR_DESCRIPTIONS:
+        if ctype in ALL_TYPES and ctype not in description.contract_types:
+            continue
         entities.append(
-            VivitSensor(
-                coordinator=coordinator,
-                name=sd["name"],
-                variable=var,
-                device_class=sd["class"],
-                device=device,
-                house_id=house_id,
-                contract_id=contract_id,
-                contract_type=ctype,
-                cups=cups,
-                contract_info=cinfo,
-                house_contract=house_contract,
-            )
+            VivitSensor(coordinator, description, device, currency, house_id, contract_id, contract)
         )
 
     # Batería virtual (solo electricidad) si hay datos
     if ctype == "ELECTRICITY":
         vb = payload.get("virtual_battery_history") or {}
         if vb and any(vb.values()):
-            for sd in VB_DEFS:
+            for description in VB_DESCRIPTIONS:
                 entities.append(
-                    VivitVBSensor(
-                        coordinator=coordinator,
-                        name=sd["name"],
-                        variable=sd["var"],
-                        device_class=sd["class"],
-                        device=device,
-                        house_id=house_id,
-                        contract_id=contract_id,
-                    )
+                    VivitVBSensor(coordinator, description, device, currency, house_id, contract_id)
                 )
-            # Último canje (si existe)
-            last_red = max((vb.get("discounts", {}) or {}).get("data", []),
-                           key=lambda x: x.get("billingDate", ""), default=None)
-            if last_red:
-                entities.append(
-                    VivitVBSensor(
-                        coordinator=coordinator,
-                        name="Batería virtual — último importe canjeado",
-                        variable="amount",
-                        device_class=SensorDeviceClass.MONETARY,
-                        device=device,
-                        house_id=house_id,
-                        contract_id=contract_id,
-                        coupon_data=last_red,
+            rollup = payload.get("vb_rollup") or {}
+            if "month" in rollup:
+                for description in VB_ROLLUP_DESCRIPTIONS:
+                    entities.append(
+                        VivitSensor(coordinator, description, device, currency, house_id, contract_id, contract)
                     )
-                )
-                entities.append(
-                    VivitVBSensor(
-                        coordinator=coordinator,
-                        name="Batería virtual — últimos kWh canjeados",
-                        variable="kWh",
-                        device_class=SensorDeviceClass.ENERGY,
-                        device=device,
-                        house_id=house_id,
-                        contract_id=contract_id,
-                        coupon_data=last_red,
+            # Último canje (si existe; calculado en la misma pasada que los agregados)
+            last_red = rollup.get("last_redemption")
+            if last_red:
+                for description in VB_COUPON_DESCRIPTIONS:
+                    entities.append(
+                        VivitVBSensor(
+                            coordinator, description, device, currency, house_id, contract_id,
+                            coupon_data=last_red,
+                        )
                     )
-                )
 
     return entities
 
 
+def _unit_for(description: SensorEntityDescription, currency: str, price_per_kwh: bool) -> Optional[str]:
+    """Unidad nativa resuelta una sola vez al crear la entidad."""
+    if description.device_class == SensorDeviceClass.MONETARY:
+        return f"{currency}/kWh" if price_per_kwh else currency
+    return description.native_unit_of_measurement
+
+
 class VivitBase(CoordinatorEntity, SensorEntity):
     """Base común para sensores Vivit."""
 
@@ -197,214 +570,122 @@ class VivitBase(CoordinatorEntity, SensorEntity):
     def __init__(
         self,
         coordinator,
-        name: str,
-        variable: str,
-        device_class: Optional[SensorDeviceClass],
+        description: VivitSensorEntityDescription | VivitVBSensorEntityDescription,
         device: DeviceInfo,
+        currency: str,
         house_id: str,
         contract_id: str,
     ):
         super().__init__(coordinator)
-        self._attr_name = name            # nombre visible del sensor (limpio)
-        self.variable = variable
-        self._attr_device_class = device_class
-        self._device = device
-        self.house_id = house_id
+        self.entity_description = description
         self.contract_id = contract_id
+        self._attr_unique_id = f"{house_id}_{contract_id}_{description.key}"
+        self._attr_device_info = device
+        self._attr_native_unit_of_measurement = _unit_for(description, currency, description.price_per_kwh)
 
-    @property
-    def unique_id(self) -> str:
-        return f"{self.house_id}_{self.contract_id}_{self.variable}"
-
-    @property
-    def device_info(self) -> DeviceInfo:
-        return self._device
-
-    @property
-    def native_unit_of_measurement(self) -> Optional[str]:
-        user_currency = self.hass.config.currency
-        if self._attr_device_class == SensorDeviceClass.ENERGY:
-            return "kWh"
-        if self._attr_device_class == SensorDeviceClass.MONETARY:
-            # variables de precio por kWh
-            if self.variable in ("pricesEnergyAmount", "excedentsPrice"):
-                return f"{user_currency}/kWh"
-            return user_currency
-        if self._attr_device_class == SensorDeviceClass.POWER:
-            return "kW"
-        return None
+    def _contract_data(self) -> Dict[str, Any]:
+        return (self.coordinator.data or {}).get(self.contract_id) or {}
 
 
 class VivitSensor(VivitBase):
     """Sensor principal (costes/estado/facturas/precios)."""
 
+    entity_description: VivitSensorEntityDescription
+
     def __init__(
         self,
         coordinator,
-        name: str,
-        variable: str,
-        device_class: Optional[SensorDeviceClass],
+        description: VivitSensorEntityDescription,
         device: DeviceInfo,
+        currency: str,
         house_id: str,
         contract_id: str,
-        contract_type: str,
-        cups: str,
-        contract_info: Dict[str, Any],
-        house_contract: Dict[str, Any],
+        contract: Dict[str, Any],
     ):
-        super().__init__(coordinator, name, variable, device_class, device, house_id, contract_id)
-        self.contract_type = contract_type
-        self.cups = cups
-        self.contract_info = contract_info or {}
-        self.house_contract = house_contract or {}
+        super().__init__(coordinator, description, device, currency, house_id, contract_id)
+        self.contract = contract
 
     @property
     def native_value(self) -> Any:
-        data = (self.coordinator.data or {}).get(self.contract_id) or {}
-
-        # COSTES
-        if self.variable in {"amount", "consumption", "totalDays", "amountVariable", "amountFixed", "averageAmount"}:
-            return (data.get("costs") or {}).get(self.variable)
-
-        # ÚLTIMA FACTURA
-        if self.variable in {"lastInvoiceAmount", "lastInvoicePaid"}:
-            inv = data.get("invoices")
-            obj = None
-            if isinstance(inv, list) and inv:
-                obj = inv[0]
-            elif isinstance(inv, dict):
-                obj = inv
-            if not obj:
-                return None if self.variable == "lastInvoiceAmount" else "No"
-            if self.variable == "lastInvoiceAmount":
-                return obj.get("amount") or obj.get("totalAmount")
-            return "Yes" if (obj.get("status") == "PAID") else "No"
-
-        # PRÓXIMA FACTURA
-        if self.variable in {"nextInvoiceAmount", "nextInvoiceVariableAmount", "nextInvoiceFixedAmount"}:
-            nxt = data.get("nextInvoice") or {}
-            if self.variable == "nextInvoiceAmount":
-                return nxt.get("amount")
-            if self.variable == "nextInvoiceVariableAmount":
-                return nxt.get("amountVariable")
-            if self.variable == "nextInvoiceFixedAmount":
-                return nxt.get("amountFixed")
-
-        # CAMPOS DE CONTRATO / PRECIOS
-        if self.contract_type == "ELECTRICITY":
-            if self.variable in {"status", "power", "fee"}:
-                return self.house_contract.get(self.variable) or self.contract_info.get(self.variable)
-
-            prices = (self.house_contract.get("prices") or self.contract_info.get("prices") or {})
-            if self.variable == "pricesPowerPunta":
-                return _parse_price_list((prices.get("power") or []), 0)
-            if self.variable == "pricesPowerValle":
-                return _parse_price_list((prices.get("power") or []), 1)
-            if self.variable == "pricesEnergyAmount":
-                return _parse_price_list((prices.get("energy") or []), 0)
-
-        if self.contract_type == "GAS":
-            if self.variable in {"fixedTerm", "variableTerm", "status"}:
-                # status desde house_contract o contract_info
-                if self.variable == "status":
-                    return self.house_contract.get("status") or self.contract_info.get("status")
-                energy_prices = (self.house_contract.get("prices") or {}).get("energy") or []
-                if self.variable == "fixedTerm":
-                    return _extract_gas_price(energy_prices, fixed=True)
-                if self.variable == "variableTerm":
-                    return _extract_gas_price(energy_prices, fixed=False)
+        return self.entity_description.value_fn(self._contract_data(), self.contract)
 
-        return None
+    @property
+    def extra_state_attributes(self) -> Optional[Dict[str, Any]]:
+        attrs_fn = self.entity_description.attrs_fn
+        if attrs_fn is None:
+            return None
+        return attrs_fn(self._contract_data())
 
 
 class VivitVBSensor(VivitBase):
     """Sensores de Batería Virtual."""
 
+    entity_description: VivitVBSensorEntityDescription
+
     def __init__(
         self,
         coordinator,
-        name: str,
-        variable: str,
-        device_class: Optional[SensorDeviceClass],
+        description: VivitVBSensorEntityDescription,
         device: DeviceInfo,
+        currency: str,
         house_id: str,
         contract_id: str,
         coupon_data: Optional[Dict[str, Any]] = None,
     ):
-        super().__init__(coordinator, name, variable, device_class, device, house_id, contract_id)
+        super().__init__(coordinator, description, device, currency, house_id, contract_id)
         self.coupon_data = coupon_data
 
     @property
     def native_value(self) -> Any:
         # Si es un sensor “coupon” (último canje), leemos de ese snapshot
-        if self.coupon_data:
-            return self.coupon_data.get(self.variable)
-
-        data = (self.coordinator.data or {}).get(self.contract_id) or {}
-        vb = data.get("virtual_battery_history") or {}
-        discounts = vb.get("discounts") or {}
-        excedents = vb.get("excedents") or {}
-
-        if self.variable == "pendingAmount":
-            c = next((c for c in (discounts.get("contracts") or []) if c.get("productCode") == self.contract_id), None)
-            return c.get("pendingAmount") if c else None
-
-        if self.variable == "kwhAvailable":
-            c = next((c for c in (discounts.get("contracts") or []) if c.get("productCode") == self.contract_id), None)
-            pending = c.get("pendingAmount") if c else 0
-            conv = next((d.get("conversionPrice") for d in (excedents.get("data") or [])), 0)
-            try:
-                return round(float(pending) / float(conv), 2) if conv else None
-            except Exception:
-                return None
-
-        if self.variable == "appliedAmount":
-            return excedents.get("appliedAmount")
-
-        if self.variable == "kwhRedeemed":
-            conv = next((d.get("conversionPrice") for d in (excedents.get("data") or [])), 0)
-            try:
-                return round(float(excedents.get("appliedAmount", 0)) / float(conv), 2) if conv else None
-            except Exception:
-                return None
-
-        if self.variable == "totalKWh":
-            try:
-                return round(float(excedents.get("totalkWh", 0)), 2)
-            except Exception:
-                return None
-
-        if self.variable == "excedentsPrice":
-            return next((d.get("conversionPrice") for d in (excedents.get("data") or [])), None)
+        if self.coupon_data is not None:
+            return self.entity_description.value_fn(self.coupon_data, self.contract_id)
+        vb = self._contract_data().get("virtual_battery_history") or {}
+        return self.entity_description.value_fn(vb, self.contract_id)
 
-        return None
 
+class VivitAccountSensor(SensorEntity):
+    """Total de la cuenta; solo escribe estado cuando cambia su valor."""
 
-def _parse_price_list(prices: List[str], index: int) -> Any:
-    """
-    Extrae números tipo '0,1234' o '0.1234' de una lista de strings y devuelve float.
-    Ej: ["Punta: 0,1234 €/kWh", "Valle: 0,0987 €/kWh"] -> 0.1234 (index=0)
-    """
-    parsed: List[str] = []
-    for p in prices:
-        m = re.search(r"(\d+,\d+|\d+\.\d+)", str(p))
-        if m:
-            parsed.append(m.group(1).replace(",", "."))
-    try:
-        return float(parsed[index])
-    except Exception:
-        return None
+    _attr_has_entity_name = False
+    _attr_should_poll = False
 
+    entity_description: VivitAccountSensorEntityDescription
 
-def _extract_gas_price(prices: List[str], fixed: bool) -> Any:
-    """Busca 'Término Fijo' o 'Término Variable' y devuelve float."""
-    key = "Término Fijo" if fixed else "Término Variable"
-    for p in prices:
-        if key in str(p):
-            m = re.search(r"(\d+,\d+|\d+\.\d+)", str(p))
-            if m:
-                try:
-                    return float(m.group(1).replace(",", "."))
-                except Exception:
-                    return None
-    return None
+    def __init__(
+        self,
+        account: AccountAggregate,
+        description: VivitAccountSensorEntityDescription,
+        currency: str,
+    ):
+        self.entity_description = description
+        self._account = account
+        self._attr_unique_id = f"account_{account.account_id}_{description.key}"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, f"account_{account.account_id}")},
+            name="Cuenta Vivit",
+            manufacturer="Vivit Energy (unofficial)",
+            model="Cuenta",
+            configuration_url="https://areacliente.repsol.es/productos-y-servicios",
+        )
+        self._attr_native_unit_of_measurement = _unit_for(description, currency, description.price_per_kwh)
+        self._attr_native_value = description.value_fn(account.totals)
+        self._attr_available = account.available
+
+    @property
+    def extra_state_attributes(self) -> Dict[str, Any]:
+        return {"contracts": self._account.totals.get("contracts") or []}
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(self._account.async_add_listener(self._handle_account_update))
+
+    @callback
+    def _handle_account_update(self) -> None:
+        value = self.entity_description.value_fn(self._account.totals)
+        available = self._account.available
+        if value == self._attr_native_value and available == self._attr_available:
+            return
+        self._attr_native_value = value
+        self._attr_available = available
+        self.async_write_ha_state()
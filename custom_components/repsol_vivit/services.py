@@ -0,0 +1,80 @@
+"""Servicios de la integración."""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Tuple
+
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+
+from .const import DOMAIN, SERVICE_DOWNLOAD_INVOICES, SERVICE_PROFILE_REFRESH
+from .invoices import InvoiceDownloader
+from .profiling import async_profile_refresh
+
+DOWNLOAD_INVOICES_SCHEMA = vol.Schema(
+    {
+        vol.Optional("contract_id"): cv.string,
+        vol.Optional("limit"): vol.All(vol.Coerce(int), vol.Range(min=1, max=50)),
+    }
+)
+
+
+PROFILE_REFRESH_SCHEMA = vol.Schema({vol.Optional("contract_id"): cv.string})
+
+
+def _iter_stores(hass: HomeAssistant) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(entry_id, store) de las entradas cargadas."""
+    for entry_id, store in (hass.data.get(DOMAIN) or {}).items():
+        if isinstance(store, dict) and "coordinator" in store:
+            yield entry_id, store
+
+
+def _iter_contracts(hass: HomeAssistant, contract_id: str | None) -> Iterator[Tuple[Dict[str, Any], str, str]]:
+    """(store de la entrada, house_id, contract_id) de los contratos cargados."""
+    for _entry_id, store in _iter_stores(hass):
+        for cid, payload in (store["coordinator"].data or {}).items():
+            if contract_id and cid != contract_id:
+                continue
+            house_id = ((payload or {}).get("contracts") or {}).get("house_id")
+            if house_id:
+                yield store, house_id, cid
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Registra los servicios del dominio (una vez, desde async_setup)."""
+
+    async def _download_invoices(call: ServiceCall) -> ServiceResponse:
+        contract_id = call.data.get("contract_id")
+        limit = call.data.get("limit")
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        for store, house_id, cid in _iter_contracts(hass, contract_id):
+            # Uno por entrada y no por llamada: la concurrencia se limita entre llamadas
+            downloader = store.get("invoice_downloader")
+            if downloader is None:
+                downloader = store["invoice_downloader"] = InvoiceDownloader(hass, store["api"])
+            results[cid] = await downloader.async_download(house_id, cid, limit)
+        return {"contracts": results}
+
+    async def _profile_refresh(call: ServiceCall) -> ServiceResponse:
+        contract_id = call.data.get("contract_id")
+        for entry_id, store in _iter_stores(hass):
+            if not contract_id or contract_id in (store["coordinator"].data or {}):
+                return await async_profile_refresh(hass, entry_id, store)
+        raise HomeAssistantError("No hay ninguna entrada cargada que perfilar")
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE_REFRESH,
+        _profile_refresh,
+        schema=PROFILE_REFRESH_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_DOWNLOAD_INVOICES,
+        _download_invoices,
+        schema=DOWNLOAD_INVOICES_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
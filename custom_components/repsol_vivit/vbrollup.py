@@ -0,0 +1,218 @@
+"""Agregados mensuales y anuales de la batería virtual.
+
+El portal devuelve siempre el histórico completo de `excedents.data` y
+`discounts.data`, pero solo crece por el extremo más reciente. Por cada lista
+se recuerda cuántos registros se han agregado y el último (el más reciente):
+en cada refresco solo se recorren los registros posteriores a él, desde el
+extremo nuevo de la lista, y solo se recalculan sus meses y años. Si la lista
+no es la anterior más registros nuevos (encoge, cambia el registro frontera o
+llega un registro con fecha no posterior) se recalcula todo. Si el histórico
+recibido es el mismo objeto que en el refresco anterior (la caché HTTP
+reutiliza el valor cuando el cuerpo no cambia), no se recorre nada.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# Meses que se exponen como atributo de los sensores mensuales
+ROLLUP_ATTR_MONTHS = 12
+
+DATE_KEYS = ("date", "billingDate", "month", "period", "startDate")
+
+# Columnas de cada agregado
+KWH_IN, CREDITED, REDEEMED, KWH_REDEEMED = range(4)
+METRICS = ("kwh_in", "credited", "redeemed", "kwh_redeemed")
+
+
+def _num(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _date_of(record: Dict[str, Any], keys: Tuple[str, ...] = DATE_KEYS) -> Optional[str]:
+    """Primera fecha del registro como texto ordenable ('YYYY-MM[-DD...]')."""
+    for key in keys:
+        raw = record.get(key)
+        if not raw:
+            continue
+        raw = str(raw)
+        if len(raw) >= 7 and raw[4] == "-":
+            return raw
+        parts = raw[:10].split("/")
+        if len(parts) == 3 and len(parts[2]) == 4:
+            return f"{parts[2]}-{int(parts[1]):02d}-{int(parts[0]):02d}"
+    return None
+
+
+def month_of(record: Dict[str, Any], keys: Tuple[str, ...] = DATE_KEYS) -> Optional[str]:
+    """'YYYY-MM' a partir de la primera fecha del registro (ISO o DD/MM/YYYY)."""
+    date = _date_of(record, keys)
+    return date[:7] if date else None
+
+
+def _period_values(agg: List[float]) -> Dict[str, Any]:
+    values: Dict[str, Any] = {m: round(agg[i], 2) for i, m in enumerate(METRICS)}
+    values["price"] = round(agg[CREDITED] / agg[KWH_IN], 4) if agg[KWH_IN] else None
+    return values
+
+
+def _newest_index(records: List[Dict[str, Any]]) -> int:
+    """Extremo reciente: el final si la lista va de antiguo a reciente, si no el principio."""
+    return len(records) - 1 if (_date_of(records[0]) or "") <= (_date_of(records[-1]) or "") else 0
+
+
+class _Cursor:
+    """Hasta dónde se ha agregado una lista de registros."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.last: Optional[Dict[str, Any]] = None
+        self.last_date = ""
+
+    def new_records(self, records: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Registros posteriores al último agregado, o None si hay que recalcular todo."""
+        n = len(records)
+        if n < self.count:
+            return None
+        if not self.count:
+            return list(records)
+        i = _newest_index(records)
+        step = -1 if i else 1
+        new: List[Dict[str, Any]] = []
+        while len(new) < n - self.count and (_date_of(records[i]) or "") > self.last_date:
+            new.append(records[i])
+            i += step
+        if len(new) != n - self.count or records[i] != self.last:
+            return None
+        return new
+
+    def advance(self, records: List[Dict[str, Any]]) -> None:
+        self.count = len(records)
+        self.last = records[_newest_index(records)] if records else None
+        self.last_date = (_date_of(self.last) or "") if self.last is not None else ""
+
+
+class VBRollup:
+    """Agregados de un contrato, actualizados solo con los registros nuevos."""
+
+    def __init__(self) -> None:
+        self.source: Any = None
+        self._excedents = _Cursor()
+        self._discounts = _Cursor()
+        self.months: Dict[str, List[float]] = {}
+        self.years: Dict[str, List[float]] = {}
+        self.last_redemption: Optional[Dict[str, Any]] = None
+        self._summary: Dict[str, Any] = {}
+
+    @staticmethod
+    def _lists(vb: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        vb = vb or {}
+        return (
+            (vb.get("excedents") or {}).get("data") or [],
+            (vb.get("discounts") or {}).get("data") or [],
+        )
+
+    def pending(self, vb: Optional[Dict[str, Any]]) -> int:
+        """Registros que recorrerá `update` (aproximado: los que exceden lo ya agregado)."""
+        if vb is self.source:
+            return 0
+        total = 0
+        for records, cursor in zip(self._lists(vb), (self._excedents, self._discounts)):
+            extra = len(records) - cursor.count
+            total += extra if extra >= 0 and cursor.count else len(records)
+        return total
+
+    def update(self, vb: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if vb is self.source:
+            return self._summary
+        self.source = vb
+        excedents, discounts = self._lists(vb)
+
+        new_ex = self._excedents.new_records(excedents)
+        new_ds = self._discounts.new_records(discounts)
+        rebuilt = new_ex is None or new_ds is None
+        if rebuilt:
+            # La lista no es la anterior más registros nuevos: desde cero
+            self.months, self.years, self.last_redemption = {}, {}, None
+            new_ex, new_ds = excedents, discounts
+
+        touched = set()
+        for rec in new_ex:
+            month = month_of(rec)
+            if month is None:
+                continue
+            kwh = _num(rec.get("kWh", rec.get("kwh")))
+            amount = rec.get("amount")
+            agg = self.months.setdefault(month, [0.0, 0.0, 0.0, 0.0])
+            agg[KWH_IN] += kwh
+            agg[CREDITED] += _num(amount) if amount is not None else kwh * _num(rec.get("conversionPrice"))
+            touched.add(month)
+
+        last = self.last_redemption
+        for rec in new_ds:
+            if last is None or rec.get("billingDate", "") > last.get("billingDate", ""):
+                last = rec
+            month = month_of(rec)
+            if month is None:
+                continue
+            agg = self.months.setdefault(month, [0.0, 0.0, 0.0, 0.0])
+            agg[REDEEMED] += _num(rec.get("amount"))
+            agg[KWH_REDEEMED] += _num(rec.get("kWh", rec.get("kwh")))
+            touched.add(month)
+        last_changed = last is not self.last_redemption
+        self.last_redemption = last
+
+        self._excedents.advance(excedents)
+        self._discounts.advance(discounts)
+
+        for year in {m[:4] for m in touched}:
+            aggs = [agg for m, agg in self.months.items() if m.startswith(year)]
+            self.years[year] = [sum(col) for col in zip(*aggs)]
+        if touched or last_changed or rebuilt:
+            self._summary = self._build_summary()
+        return self._summary
+
+    def _build_summary(self) -> Dict[str, Any]:
+        """Valores y atributos ya listos para los sensores."""
+        if not self.months:
+            return {"last_redemption": self.last_redemption} if self.last_redemption else {}
+        months = sorted(self.months)
+        years = sorted(self.years)
+        recent = {m: _period_values(self.months[m]) for m in months[-ROLLUP_ATTR_MONTHS:]}
+        all_years = {y: _period_values(self.years[y]) for y in years}
+        return {
+            "month": {"period": months[-1], **recent[months[-1]]},
+            "year": {"period": years[-1], **all_years[years[-1]]},
+            "months": recent,
+            "years": all_years,
+            "last_redemption": self.last_redemption,
+        }
+
+
+class VBRollups:
+    """Agregados de batería virtual de todos los contratos de una entrada."""
+
+    def __init__(self) -> None:
+        self._rollups: Dict[str, VBRollup] = {}
+
+    def pending_records(self, data: Dict[str, Any]) -> int:
+        """Registros que recorrerá el próximo `add` (solo históricos que han cambiado)."""
+        total = 0
+        for contract_id, payload in data.items():
+            vb = payload.get("virtual_battery_history")
+            if not vb:
+                continue
+            rollup = self._rollups.get(contract_id)
+            total += rollup.pending(vb) if rollup is not None else sum(map(len, VBRollup._lists(vb)))
+        return total
+
+    def add(self, data: Dict[str, Any]) -> None:
+        """Anota `vb_rollup` en cada contrato con histórico de batería virtual."""
+        for contract_id, payload in data.items():
+            vb = payload.get("virtual_battery_history")
+            if not vb:
+                continue
+            rollup = self._rollups.setdefault(contract_id, VBRollup())
+            payload["vb_rollup"] = rollup.update(vb)
@@ -0,0 +1,25 @@
+"""Carga los módulos de la integración sin importar Home Assistant.
+
+`custom_components/repsol_vivit/__init__.py` importa homeassistant; aquí se
+registra un paquete vacío con la misma ruta para que `api.py`, `const.py` y
+demás módulos sin dependencias de HA se puedan importar desde scripts.
+"""
+from __future__ import annotations
+
+import importlib
+import sys
+import types
+from pathlib import Path
+from types import ModuleType
+
+PACKAGE = "repsol_vivit"
+PACKAGE_DIR = Path(__file__).resolve().parents[1] / "custom_components" / PACKAGE
+
+
+def load(module: str) -> ModuleType:
+    """Importa `repsol_vivit.<module>` sin ejecutar el `__init__` de la integración."""
+    if PACKAGE not in sys.modules:
+        pkg = types.ModuleType(PACKAGE)
+        pkg.__path__ = [str(PACKAGE_DIR)]
+        sys.modules[PACKAGE] = pkg
+    return importlib.import_module(f"{PACKAGE}.{module}")
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Exportador masivo sin Home Assistant.
+
+Lee un fichero JSON de credenciales, consulta muchas cuentas con concurrencia
+acotada y un límite de peticiones/seg compartido, y escribe cada contrato en
+cuanto llega (JSONL o CSV), sin construir el resultado completo en memoria.
+
+    python scripts/vivit_export.py cuentas.json -o salida.jsonl
+    python scripts/vivit_export.py cuentas.json -f csv --concurrency 8 --rate 5
+    python scripts/vivit_export.py cuentas.json \\
+        --base-url http://127.0.0.1:8080/api/proxy/ \\
+        --login-url http://127.0.0.1:8080/accounts.login
+
+Formato de credenciales:
+
+    [{"username": "...", "password": "...", "contract_id": "opcional", "label": "opcional"}]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import sys
+from typing import Any, Dict, IO, List, Optional
+
+import aiohttp
+
+import _standalone
+
+api = _standalone.load("api")
+const = _standalone.load("const")
+
+LOGGER = logging.getLogger("vivit_export")
+
+CSV_FIELDS = [
+    "account", "contract_id", "contract_type", "cups", "house_id", "active",
+    "amount", "amountFixed", "amountVariable", "averageAmount", "consumption", "totalDays",
+    "nextInvoiceAmount", "nextInvoiceVariableAmount", "nextInvoiceFixedAmount",
+    "lastInvoiceAmount", "lastInvoiceStatus", "vbPendingAmount", "error",
+]
+
+
+class RateLimiter:
+    """Espaciado mínimo entre peticiones, compartido por todas las cuentas."""
+
+    def __init__(self, rate: float) -> None:
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self._interval:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            wait = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class JsonlWriter:
+    def __init__(self, out: IO[str]) -> None:
+        self._out = out
+
+    def write(self, account: str, contract_id: Optional[str], payload: Optional[Dict[str, Any]],
+              error: Optional[str] = None) -> None:
+        rec: Dict[str, Any] = {"account": account, "contract_id": contract_id}
+        if error is not None:
+            rec["error"] = error
+        else:
+            rec["data"] = payload
+        self._out.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._out.flush()
+
+
+class CsvWriter:
+    def __init__(self, out: IO[str]) -> None:
+        self._out = out
+        self._writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, account: str, contract_id: Optional[str], payload: Optional[Dict[str, Any]],
+              error: Optional[str] = None) -> None:
+        self._writer.writerow(_flatten(account, contract_id, payload or {}, error))
+        self._out.flush()
+
+
+def _flatten(account: str, contract_id: Optional[str], payload: Dict[str, Any],
+             error: Optional[str]) -> Dict[str, Any]:
+    contract = payload.get("contracts") or {}
+    costs = payload.get("costs") or {}
+    nxt = payload.get("nextInvoice") or {}
+    inv = payload.get("invoices")
+    last_inv = inv[0] if isinstance(inv, list) and inv else (inv if isinstance(inv, dict) else {})
+    vb = payload.get("virtual_battery_history") or {}
+    vb_contract = next(
+        (c for c in ((vb.get("discounts") or {}).get("contracts") or [])
+         if c.get("productCode") == contract_id),
+        {},
+    )
+    row = {
+        "account": account,
+        "contract_id": contract_id,
+        "contract_type": contract.get("contractType"),
+        "cups": contract.get("cups"),
+        "house_id": contract.get("house_id"),
+        "active": contract.get("active"),
+        "nextInvoiceAmount": nxt.get("amount"),
+        "nextInvoiceVariableAmount": nxt.get("amountVariable"),
+        "nextInvoiceFixedAmount": nxt.get("amountFixed"),
+        "lastInvoiceAmount": (last_inv or {}).get("amount") or (last_inv or {}).get("totalAmount"),
+        "lastInvoiceStatus": (last_inv or {}).get("status"),
+        "vbPendingAmount": vb_contract.get("pendingAmount"),
+        "error": error,
+    }
+    row.update({k: costs.get(k) for k in
+                ("amount", "amountFixed", "amountVariable", "averageAmount", "consumption", "totalDays")})
+    return row
+
+
+async def _export_account(
+    session: aiohttp.ClientSession,
+    account: Dict[str, Any],
+    writer: JsonlWriter | CsvWriter,
+    semaphore: asyncio.Semaphore,
+    args: argparse.Namespace,
+) -> int:
+    label = account.get("label") or account["username"]
+    client = api.RepsolLuzYGasAPI(
+        session=session,
+        username=account["username"],
+        password=account["password"],
+        selected_contract_id=account.get("contract_id"),
+        base_url=args.base_url,
+        login_url=args.login_url,
+        # Una sola pasada por cuenta: la caché HTTP solo retendría cuerpos ya escritos
+        http_cache_entries=0,
+    )
+    written = 0
+    async with semaphore:
+        try:
+            async for contract_id, payload in client.async_iter_contract_data():
+                writer.write(label, contract_id, payload)
+                written += 1
+        except Exception as e:  # noqa: BLE001
+            LOGGER.warning("Cuenta %s: %s", label, e)
+            writer.write(label, None, None, error=str(e) or type(e).__name__)
+    return written
+
+
+async def _run(args: argparse.Namespace) -> int:
+    with open(args.credentials, encoding="utf-8") as f:
+        accounts: List[Dict[str, Any]] = json.load(f)
+
+    out: IO[str] = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    fmt = args.format or ("csv" if (args.output or "").endswith(".csv") else "jsonl")
+    writer = CsvWriter(out) if fmt == "csv" else JsonlWriter(out)
+
+    limiter = RateLimiter(args.rate)
+
+    async def _on_request_start(session, ctx, params) -> None:
+        await limiter.acquire()
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    try:
+        # Sin cookie jar compartido: cada cliente envía sus propias cookies
+        async with aiohttp.ClientSession(
+            trace_configs=[trace],
+            cookie_jar=aiohttp.DummyCookieJar(),
+            connector=aiohttp.TCPConnector(limit=args.concurrency * 2),
+        ) as session:
+            counts = await asyncio.gather(
+                *(_export_account(session, a, writer, semaphore, args) for a in accounts)
+            )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    LOGGER.info("Exportados %s contratos de %s cuentas", sum(counts), len(accounts))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("credentials", help="fichero JSON con la lista de cuentas")
+    parser.add_argument("-o", "--output", help="fichero de salida (por defecto stdout)")
+    parser.add_argument("-f", "--format", choices=("jsonl", "csv"), help="por defecto según extensión, o jsonl")
+    parser.add_argument("--concurrency", type=int, default=4, help="cuentas consultadas en paralelo")
+    parser.add_argument("--rate", type=float, default=2.0, help="peticiones/seg máximas en total (0 = sin límite)")
+    parser.add_argument("--base-url", default=const.BASE_API_URL)
+    parser.add_argument("--login-url", default=const.LOGIN_URL)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        stream=sys.stderr,
+    )
+    return asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Reproduce sin red un tráfico grabado con la opción `record_traffic`.
+
+Ejecuta el mismo cliente (`api.py`) contra el archivo `.jsonl.gz` y mide cada
+refresco, con las latencias originales o lo más rápido posible; opcionalmente
+bajo cProfile.
+
+    python scripts/vivit_replay.py grabacion.jsonl.gz
+    python scripts/vivit_replay.py grabacion.jsonl.gz --fast --cycles 20 --profile replay.prof
+    python scripts/vivit_replay.py grabacion.jsonl.gz --warm --cycles 5   # mismo cliente (cachés activas)
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import cProfile
+import logging
+import pstats
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import _standalone
+
+api = _standalone.load("api")
+const = _standalone.load("const")
+recording = _standalone.load("recording")
+
+
+async def replay(args: argparse.Namespace) -> int:
+    session = recording.ReplaySession.from_file(args.archive, realtime=not args.fast)
+    client = None
+    for cycle in range(1, args.cycles + 1):
+        if client is None or not args.warm:
+            client = api.RepsolLuzYGasAPI(
+                session=session,
+                username="replay",
+                password="replay",
+                selected_contract_id=args.contract,
+                base_url=args.base_url,
+                login_url=args.login_url,
+            )
+        before, misses = session.requests, session.misses
+        t0 = time.perf_counter()
+        try:
+            data = await client.fetch_all_data()
+            status = f"{len(data)} contratos"
+        except Exception as e:  # noqa: BLE001
+            status = f"error: {e}"
+        elapsed = time.perf_counter() - t0
+        print(f"ciclo {cycle:>3}: {elapsed * 1000:9.1f} ms  peticiones={session.requests - before:<3} "
+              f"sin_grabar={session.misses - misses:<3} {status}")
+    return 1 if session.misses else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("archive", type=Path, help="archivo .jsonl.gz grabado")
+    parser.add_argument("--fast", action="store_true", help="sin esperar las latencias grabadas")
+    parser.add_argument("--cycles", type=int, default=1, help="refrescos a reproducir")
+    parser.add_argument("--warm", action="store_true",
+                        help="reutiliza el cliente entre ciclos (TTL y caché HTTP activas)")
+    parser.add_argument("--contract", help="contract_id seleccionado al grabar, si lo había")
+    parser.add_argument("--base-url", default=const.BASE_API_URL)
+    parser.add_argument("--login-url", default=const.LOGIN_URL)
+    parser.add_argument("--profile", type=Path, help="guarda un perfil cProfile (.prof)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    if not args.profile:
+        return asyncio.run(replay(args))
+
+    profiler = cProfile.Profile()
+    rc = profiler.runcall(asyncio.run, replay(args))
+    profiler.dump_stats(args.profile)
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    print(f"Perfil guardado en {args.profile}")
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())